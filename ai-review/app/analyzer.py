@@ -1,13 +1,26 @@
+import functools
 import os
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Dict, Any, Optional
 from pathlib import Path
-from .model_runner import ModelRunner
+from .model_runner import AI_FAILURE_MESSAGE, ModelRunner
+
+# Extensions listed in the project structure; code files are the analyzable subset
+_STRUCTURE_EXTS = frozenset({'.py', '.js', '.jsx', '.ts', '.tsx', '.html', '.css'})
+_CODE_EXTS = frozenset({'.py', '.js', '.jsx', '.ts', '.tsx'})
+
+def _extension(name: str) -> str:
+    """Return the dotted suffix of a file name, or an empty string."""
+    dot = name.rfind('.')
+    return name[dot:] if dot != -1 else ''
 
 class CodeAnalyzer:
     def __init__(self):
         self.model_runner = ModelRunner()
         self.file_issues_cache = {}
         self.project_structure = {}
+        self._code_files = []
+        self._scanned_root = None
 
     def analyze_project(self, project_root: str) -> List[Dict[str, Any]]:
         """Analyze all code files in a project directory."""
@@ -20,22 +33,31 @@ class CodeAnalyzer:
                 severity="error"
             )]
 
-        self._scan_project_structure(project_root)
-        all_issues = []
-        
-        # First pass: Analyze individual files
-        for file_path in self._get_code_files(project_root):
-            file_issues = self.analyze_file(file_path)
-            all_issues.extend(file_issues)
+        # First pass: Analyze individual files concurrently. Threads rather than
+        # processes so every worker shares the single GPU-resident model. Files
+        # are submitted as the walk finds them so inference overlaps discovery.
+        max_workers = int(os.getenv('MAX_ANALYSIS_WORKERS', '4'))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(self.analyze_file, file_path)
+                for file_path in self._iter_project_files(project_root)
+            ]
+            
+            all_issues = []
+            # Collect in discovery order to keep the output deterministic
+            for future in futures:
+                all_issues.extend(future.result())
             
         # Second pass: Cross-file analysis
         cross_file_issues = self._analyze_cross_file_issues()
         all_issues.extend(cross_file_issues)
-        
+
         return all_issues
 
     def analyze_file(self, file_path: str) -> List[Dict[str, Any]]:
         """Analyze a single code file."""
+        # Only a successful analysis of the current content may be reused
+        self.file_issues_cache.pop(file_path, None)
         if not os.path.exists(file_path):
             return [self._create_issue(
                 file_path=file_path,
@@ -49,11 +71,14 @@ class CodeAnalyzer:
             with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
                 code = f.read()
                 
-            # Get file-specific issues
-            file_issues = self.model_runner.analyze_code(code, file_path)
+            # Get file-specific issues; the runner's prompt-digest cache skips
+            # the model when the code, path and project context are unchanged
+            file_issues = self.model_runner.analyze(code, file_path)
             
-            # Cache issues for cross-file analysis
-            self.file_issues_cache[file_path] = file_issues
+            # Cache issues for cross-file analysis; a failed model run is not
+            # recorded
+            if not any(issue.get('message') == AI_FAILURE_MESSAGE for issue in file_issues):
+                self.file_issues_cache[file_path] = file_issues
             
             # Add file path to each issue
             for issue in file_issues:
@@ -70,24 +95,48 @@ class CodeAnalyzer:
                 severity="error"
             )]
 
-    def _scan_project_structure(self, root_dir: str) -> None:
-        """Scan and cache project structure for cross-file analysis."""
+    def _iter_project_files(self, root_dir: str) -> Iterator[str]:
+        """
+        Walk the project, refreshing the cached structure and code file list,
+        and yield each code file as soon as it is found.
+        """
         self.project_structure = {}
-        for root, _, files in os.walk(root_dir):
-            rel_path = os.path.relpath(root, root_dir)
-            self.project_structure[rel_path] = [
-                f for f in files 
-                if f.endswith(('.py', '.js', '.jsx', '.ts', '.tsx', '.html', '.css'))
-            ]
+        self._code_files = []
+        self._scanned_root = None
+        stack = [root_dir]
+        while stack:
+            current = stack.pop()
+            names = []
+            subdirs = []
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                            continue
+                        ext = _extension(entry.name)
+                        if ext in _STRUCTURE_EXTS:
+                            names.append(entry.name)
+                            if ext in _CODE_EXTS:
+                                self._code_files.append(entry.path)
+                                yield entry.path
+            except OSError:
+                continue
+            self.project_structure[os.path.relpath(current, root_dir)] = names
+            # Reverse so directories are visited in listing order
+            stack.extend(reversed(subdirs))
+        self._scanned_root = root_dir
+
+    def _scan_project_structure(self, root_dir: str) -> None:
+        """Scan and cache project structure and code files in a single pass."""
+        for _ in self._iter_project_files(root_dir):
+            pass
 
     def _get_code_files(self, root_dir: str) -> List[str]:
         """Get all code files in the project."""
-        code_files = []
-        for root, _, files in os.walk(root_dir):
-            for file in files:
-                if file.endswith(('.py', '.js', '.jsx', '.ts', '.tsx')):
-                    code_files.append(os.path.join(root, file))
-        return code_files
+        if self._scanned_root != root_dir:
+            self._scan_project_structure(root_dir)
+        return list(self._code_files)
 
     def _analyze_cross_file_issues(self) -> List[Dict[str, Any]]:
         """Analyze issues that span multiple files."""
@@ -118,7 +167,11 @@ class CodeAnalyzer:
         }
 
 # Backward compatibility
+@functools.lru_cache(maxsize=1)
+def _get_analyzer() -> CodeAnalyzer:
+    """Return the process-wide analyzer so its runner and model are reused."""
+    return CodeAnalyzer()
+
 def analyze_code(file_path: str) -> List[Dict[str, Any]]:
     """Legacy function for backward compatibility."""
-    analyzer = CodeAnalyzer()
-    return analyzer.analyze_file(file_path)
+    return _get_analyzer().analyze_file(file_path)
@@ -5,30 +5,247 @@ Handles connected dependencies and provides better context to AI models.
 
 import os
 import ast
+import json
 import re
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Set, Optional, Any, Tuple
 from pathlib import Path
 
+try:
+    import hyperscan
+except ImportError:  # Optional accelerator; plain `re` is used without it
+    hyperscan = None
+
+try:
+    import orjson
+except ImportError:  # Optional speedup; stdlib json is used without it
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+_json_loads = orjson.loads if orjson else json.loads
+
+# JavaScript/TypeScript extraction patterns, compiled once at import
+_JS_IMPORT_RES = tuple(re.compile(p, re.MULTILINE) for p in (
+    r'import\s+(?:(?:\{[^}]+\}|\w+|\*\s+as\s+\w+)\s+from\s+)?[\'"]([^\'"]+)[\'"]',
+    r'require\([\'"]([^\'"]+)[\'"]\)',
+    r'import\([\'"]([^\'"]+)[\'"]\)'
+))
+_JS_EXPORT_RES = tuple(re.compile(p, re.MULTILINE) for p in (
+    r'export\s+(?:default\s+)?(?:function\s+(\w+)|class\s+(\w+)|const\s+(\w+)|let\s+(\w+)|var\s+(\w+))',
+    r'module\.exports\s*=\s*(\w+)',
+    r'exports\.(\w+)\s*='
+))
+_JS_FUNCTION_RES = tuple(re.compile(p, re.MULTILINE) for p in (
+    r'function\s+(\w+)\s*\(',
+    r'const\s+(\w+)\s*=\s*(?:async\s+)?\([^)]*\)\s*=>',
+    r'(\w+)\s*:\s*(?:async\s+)?function\s*\(',
+    r'async\s+function\s+(\w+)\s*\('
+))
+_JS_CLASS_RE = re.compile(r'class\s+(\w+)(?:\s+extends\s+(\w+))?\s*\{', re.MULTILINE)
+_JS_ALL_RES = _JS_IMPORT_RES + _JS_EXPORT_RES + _JS_FUNCTION_RES + (_JS_CLASS_RE,)
+
+# `name: function(` starts with (\w+), so `re` retries it at every word character.
+# Scanning for the literal tail and reading the name backwards gives the same matches.
+_JS_PROPERTY_FUNCTION_RE = _JS_FUNCTION_RES[2]
+_JS_PROPERTY_FUNCTION_TAIL_RE = re.compile(r':\s*(?:async\s+)?function\s*\(')
+
+def _js_property_function_names(content: str) -> List[str]:
+    """Return the names matched by _JS_PROPERTY_FUNCTION_RE, in order."""
+    names = []
+    for match in _JS_PROPERTY_FUNCTION_TAIL_RE.finditer(content):
+        end = match.start()
+        while end > 0 and content[end - 1].isspace():
+            end -= 1
+        start = end
+        while start > 0 and (content[start - 1].isalnum() or content[start - 1] == '_'):
+            start -= 1
+        if start < end:
+            names.append(content[start:end])
+    return names
+
+def _build_js_prefilter():
+    """Compile all JS patterns into one Hyperscan database, if available."""
+    if hyperscan is None:
+        return None
+    try:
+        database = hyperscan.Database()
+        flags = (hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP |
+                 hyperscan.HS_FLAG_MULTILINE | hyperscan.HS_FLAG_SINGLEMATCH)
+        database.compile(
+            expressions=[p.pattern.encode() for p in _JS_ALL_RES],
+            ids=list(range(len(_JS_ALL_RES))),
+            elements=len(_JS_ALL_RES),
+            flags=[flags] * len(_JS_ALL_RES)
+        )
+        return database
+    except Exception as e:
+        logger.warning(f"Hyperscan prefilter disabled: {e}")
+        return None
+
+_JS_PREFILTER = _build_js_prefilter()
+# Hyperscan scratch space is not safe to share between concurrent scans
+_JS_PREFILTER_LOCK = threading.Lock()
+
+def _js_patterns_present(content: str) -> Optional[Set[Any]]:
+    """
+    Return the JS patterns that match somewhere in content using a single
+    Hyperscan pass, or None when Hyperscan is unavailable. Hyperscan cannot
+    report capture groups, so `re` still extracts names for the patterns found.
+    """
+    if _JS_PREFILTER is None:
+        return None
+    present = set()
+    
+    def on_match(pattern_id, start, end, flags, context):
+        present.add(_JS_ALL_RES[pattern_id])
+    
+    try:
+        with _JS_PREFILTER_LOCK:
+            _JS_PREFILTER.scan(content.encode('utf-8', 'ignore'), match_event_handler=on_match)
+    except Exception as e:
+        logger.debug(f"Hyperscan scan failed, falling back to re: {e}")
+        return None
+    return present
+
+class _PythonExtractor(ast.NodeVisitor):
+    """Collects imports and definitions from module and class bodies without entering functions."""
+    
+    STATEMENT_FIELDS = ('body', 'orelse', 'finalbody', 'handlers', 'cases')
+    
+    def __init__(self, info: Dict[str, Any]):
+        self.info = info
+    
+    def generic_visit(self, node: ast.AST) -> None:
+        # Only follow nested statement blocks (if/try/with/loops), never expressions
+        for field in self.STATEMENT_FIELDS:
+            children = getattr(node, field, None)
+            if isinstance(children, list):
+                for child in children:
+                    self.visit(child)
+    
+    def visit_Import(self, node: ast.Import) -> None:
+        for alias in node.names:
+            self.info["imports"].append({
+                "name": alias.name,
+                "alias": alias.asname,
+                "type": "import"
+            })
+    
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        module = node.module or ""
+        for alias in node.names:
+            self.info["imports"].append({
+                "name": f"{module}.{alias.name}" if module else alias.name,
+                "alias": alias.asname,
+                "type": "from_import",
+                "module": module
+            })
+    
+    def _add_function(self, node: ast.AST, is_async: bool) -> None:
+        self.info["functions"].append({
+            "name": node.name,
+            "args": [arg.arg for arg in node.args.args],
+            "line": node.lineno,
+            "is_async": is_async
+        })
+    
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        self._add_function(node, is_async=False)
+    
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> None:
+        self._add_function(node, is_async=True)
+    
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        self.info["classes"].append({
+            "name": node.name,
+            "bases": [base.id if isinstance(base, ast.Name) else str(base) for base in node.bases],
+            "line": node.lineno
+        })
+        # Descend into the class body to pick up methods and class attributes
+        self.generic_visit(node)
+    
+    def visit_Assign(self, node: ast.Assign) -> None:
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                self.info["variables"].append({
+                    "name": target.id,
+                    "line": node.lineno,
+                    "type": "assignment"
+                })
+
 class ContextAnalyzer:
     """Analyzes code context across multiple files to improve AI analysis."""
     
+    IGNORED_DIRS = frozenset({'node_modules', '__pycache__', 'venv', 'env'})
+    MAX_WORKERS = 8  # Concurrent file reads/parses per context build
+    MAX_PARSE_CHARS = 256 * 1024  # Larger files are analyzed from their head only
+    PREVIEW_LENGTHS = {"python": 500, "javascript": 500, "generic": 300}
+    
+    CODE_EXTENSIONS = frozenset({
+        '.py', '.js', '.jsx', '.ts', '.tsx', '.java', '.cpp', '.c', '.h',
+        '.cs', '.php', '.rb', '.go', '.rs', '.swift', '.kt', '.scala',
+        '.html', '.css', '.scss', '.sass', '.less', '.vue', '.svelte'
+    })
+    
+    # Project-level files worth including as context
+    COMMON_FILES = (
+        "package.json", "requirements.txt", "setup.py", "Dockerfile",
+        "docker-compose.yml", ".env.example", "README.md",
+        "app.py", "main.py", "index.js", "server.js", "app.js"
+    )
+    
+    # Root-level files that reveal parts of the technology stack
+    TECH_STACK_INDICATORS = {
+        "package.json": {"languages": ["javascript"], "package_managers": ["npm"]},
+        "requirements.txt": {"languages": ["python"], "package_managers": ["pip"]},
+        "Pipfile": {"languages": ["python"], "package_managers": ["pipenv"]},
+        "setup.py": {"languages": ["python"]},
+        "Dockerfile": {"tools": ["docker"]},
+        "docker-compose.yml": {"tools": ["docker-compose"]},
+        "yarn.lock": {"package_managers": ["yarn"]},
+        "pom.xml": {"languages": ["java"], "package_managers": ["maven"]},
+        "build.gradle": {"languages": ["java"], "package_managers": ["gradle"]},
+        "Cargo.toml": {"languages": ["rust"], "package_managers": ["cargo"]},
+        "go.mod": {"languages": ["go"], "package_managers": ["go"]},
+    }
+    
+    # package.json dependency substrings mapped to framework names
+    FRAMEWORK_INDICATORS = {
+        "react": "React",
+        "vue": "Vue.js",
+        "angular": "Angular",
+        "express": "Express.js",
+        "next": "Next.js",
+        "nuxt": "Nuxt.js",
+        "svelte": "Svelte",
+        "gatsby": "Gatsby",
+        "webpack": "Webpack",
+        "vite": "Vite",
+        "typescript": "TypeScript"
+    }
+    
     def __init__(self):
+        self._tech_stack_cache = {}
         self.file_dependencies = {}
         self.import_graph = {}
         self.function_definitions = {}
         self.class_definitions = {}
         self.variable_definitions = {}
     
-    def analyze_project_context(self, project_path: str, target_file: str) -> Dict[str, Any]:
+    def analyze_project_context(self, project_path: str, target_file: str,
+                                include_previews: bool = True) -> Dict[str, Any]:
         """
         Analyze the entire project context for better AI understanding.
         
         Args:
             project_path: Root path of the project
             target_file: The file being analyzed
+            include_previews: Add a content_preview to every related file. When
+                False, each file info keeps its content under "_content" instead
+                so the caller can build only the previews it uses.
             
         Returns:
             Dictionary containing project context information
@@ -50,9 +267,13 @@ class ContextAnalyzer:
             # Get all relevant files
             relevant_files = self._get_relevant_files(project_path, target_file)
             
-            # Analyze each file
-            for file_path in relevant_files:
-                file_info = self._analyze_file(file_path)
+            # Analyze files concurrently so reads overlap with parsing
+            with ThreadPoolExecutor(max_workers=min(self.MAX_WORKERS, len(relevant_files))) as executor:
+                results = list(executor.map(
+                    lambda path: self._analyze_file(path, include_previews), relevant_files
+                ))
+            
+            for file_path, file_info in zip(relevant_files, results):
                 if file_info:
                     rel_path = os.path.relpath(file_path, project_path)
                     context["related_files"][rel_path] = file_info
@@ -85,59 +306,77 @@ class ContextAnalyzer:
         # Get files in the same directory
         target_dir = os.path.dirname(target_file)
         try:
-            for file in os.listdir(target_dir):
-                file_path = os.path.join(target_dir, file)
-                if self._is_code_file(file_path) and file_path != target_file:
-                    relevant_files.append(file_path)
-                    if len(relevant_files) >= max_files:
-                        break
+            with os.scandir(target_dir) as entries:
+                for entry in entries:
+                    if entry.path != target_file and self._is_code_file(entry.name) and entry.is_file():
+                        relevant_files.append(entry.path)
+                        if len(relevant_files) >= max_files:
+                            break
         except OSError:
             pass
         
-        # Get common project files
-        common_files = [
-            "package.json", "requirements.txt", "setup.py", "Dockerfile",
-            "docker-compose.yml", ".env.example", "README.md",
-            "app.py", "main.py", "index.js", "server.js", "app.js"
-        ]
+        # Get common project files from a single listing of the project root
+        try:
+            with os.scandir(project_path) as entries:
+                present = {entry.name for entry in entries}
+        except OSError:
+            present = set()
         
-        for common_file in common_files:
-            common_path = os.path.join(project_path, common_file)
-            if os.path.exists(common_path) and common_path not in relevant_files:
-                relevant_files.append(common_path)
-                if len(relevant_files) >= max_files:
-                    break
+        for common_file in self.COMMON_FILES:
+            if len(relevant_files) >= max_files:
+                break
+            if common_file in present:
+                common_path = os.path.join(project_path, common_file)
+                if common_path not in relevant_files:
+                    relevant_files.append(common_path)
         
         return relevant_files[:max_files]
     
     def _is_code_file(self, file_path: str) -> bool:
         """Check if file is a code file."""
-        code_extensions = {
-            '.py', '.js', '.jsx', '.ts', '.tsx', '.java', '.cpp', '.c', '.h',
-            '.cs', '.php', '.rb', '.go', '.rs', '.swift', '.kt', '.scala',
-            '.html', '.css', '.scss', '.sass', '.less', '.vue', '.svelte'
-        }
-        return Path(file_path).suffix.lower() in code_extensions
+        name = os.path.basename(file_path)
+        dot = name.rfind('.')
+        # A leading dot marks a hidden file, not an extension (as with Path.suffix)
+        return dot > 0 and name[dot:].lower() in self.CODE_EXTENSIONS
     
-    def _analyze_file(self, file_path: str) -> Optional[Dict[str, Any]]:
+    def _analyze_file(self, file_path: str, include_preview: bool = True) -> Optional[Dict[str, Any]]:
         """Analyze a single file for context information."""
         try:
+            # Only the head of very large files is read; context needs no more
             with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
+                content = f.read(self.MAX_PARSE_CHARS + 1)
+            
+            truncated = len(content) > self.MAX_PARSE_CHARS
+            if truncated:
+                # Cut at a line boundary so parsers see whole statements
+                content = content[:content.rfind('\n', 0, self.MAX_PARSE_CHARS) + 1 or self.MAX_PARSE_CHARS]
             
             file_ext = Path(file_path).suffix.lower()
             
             if file_ext == '.py':
-                return self._analyze_python_file(content, file_path)
+                info = self._analyze_python_file(content, file_path)
             elif file_ext in ['.js', '.jsx', '.ts', '.tsx']:
-                return self._analyze_javascript_file(content, file_path)
+                info = self._analyze_javascript_file(content, file_path)
+            else:
+                info = self._analyze_generic_file(content, file_path)
+            
+            if include_preview:
+                info["content_preview"] = self._content_preview(info["type"], content)
             else:
-                return self._analyze_generic_file(content, file_path)
+                info["_content"] = content
+            if truncated:
+                info["truncated"] = True
+            return info
                 
         except Exception as e:
             logger.error(f"Error analyzing file {file_path}: {e}")
             return None
     
+    def _content_preview(self, file_type: str, content: str) -> str:
+        """Return the head of content used to show a related file to the model."""
+        limit = self.PREVIEW_LENGTHS.get(file_type, 300)
+        return content[:limit] + "..." if len(content) > limit else content
+    
     def _analyze_python_file(self, content: str, file_path: str) -> Dict[str, Any]:
         """Analyze Python file for imports, functions, classes, etc."""
         info = {
@@ -146,55 +385,16 @@ class ContextAnalyzer:
             "exports": [],
             "functions": [],
             "classes": [],
-            "variables": [],
-            "content_preview": content[:500] + "..." if len(content) > 500 else content
+            "variables": []
         }
         
+        # Empty modules (typically __init__.py) have nothing to extract
+        if not content or content.isspace():
+            return info
+        
         try:
-            tree = ast.parse(content)
-            
-            for node in ast.walk(tree):
-                if isinstance(node, ast.Import):
-                    for alias in node.names:
-                        info["imports"].append({
-                            "name": alias.name,
-                            "alias": alias.asname,
-                            "type": "import"
-                        })
-                
-                elif isinstance(node, ast.ImportFrom):
-                    module = node.module or ""
-                    for alias in node.names:
-                        info["imports"].append({
-                            "name": f"{module}.{alias.name}" if module else alias.name,
-                            "alias": alias.asname,
-                            "type": "from_import",
-                            "module": module
-                        })
-                
-                elif isinstance(node, ast.FunctionDef):
-                    info["functions"].append({
-                        "name": node.name,
-                        "args": [arg.arg for arg in node.args.args],
-                        "line": node.lineno,
-                        "is_async": isinstance(node, ast.AsyncFunctionDef)
-                    })
-                
-                elif isinstance(node, ast.ClassDef):
-                    info["classes"].append({
-                        "name": node.name,
-                        "bases": [base.id if isinstance(base, ast.Name) else str(base) for base in node.bases],
-                        "line": node.lineno
-                    })
-                
-                elif isinstance(node, ast.Assign):
-                    for target in node.targets:
-                        if isinstance(target, ast.Name):
-                            info["variables"].append({
-                                "name": target.id,
-                                "line": node.lineno,
-                                "type": "assignment"
-                            })
+            tree = ast.parse(content, filename=file_path, type_comments=False)
+            _PythonExtractor(info).visit(tree)
         
         except SyntaxError as e:
             logger.warning(f"Syntax error in {file_path}: {e}")
@@ -210,35 +410,27 @@ class ContextAnalyzer:
             "exports": [],
             "functions": [],
             "classes": [],
-            "variables": [],
-            "content_preview": content[:500] + "..." if len(content) > 500 else content
+            "variables": []
         }
         
+        # Patterns that cannot match are skipped when the prefilter is available
+        present = _js_patterns_present(content)
+        
         # Extract imports
-        import_patterns = [
-            r'import\s+(?:(?:\{[^}]+\}|\w+|\*\s+as\s+\w+)\s+from\s+)?[\'"]([^\'"]+)[\'"]',
-            r'require\([\'"]([^\'"]+)[\'"]\)',
-            r'import\([\'"]([^\'"]+)[\'"]\)'
-        ]
-        
-        for pattern in import_patterns:
-            matches = re.finditer(pattern, content, re.MULTILINE)
-            for match in matches:
+        for pattern in _JS_IMPORT_RES:
+            if present is not None and pattern not in present:
+                continue
+            for match in pattern.finditer(content):
                 info["imports"].append({
                     "name": match.group(1),
                     "type": "import"
                 })
         
         # Extract exports
-        export_patterns = [
-            r'export\s+(?:default\s+)?(?:function\s+(\w+)|class\s+(\w+)|const\s+(\w+)|let\s+(\w+)|var\s+(\w+))',
-            r'module\.exports\s*=\s*(\w+)',
-            r'exports\.(\w+)\s*='
-        ]
-        
-        for pattern in export_patterns:
-            matches = re.finditer(pattern, content, re.MULTILINE)
-            for match in matches:
+        for pattern in _JS_EXPORT_RES:
+            if present is not None and pattern not in present:
+                continue
+            for match in pattern.finditer(content):
                 name = next((g for g in match.groups() if g), "unknown")
                 info["exports"].append({
                     "name": name,
@@ -246,23 +438,21 @@ class ContextAnalyzer:
                 })
         
         # Extract functions
-        function_patterns = [
-            r'function\s+(\w+)\s*\(',
-            r'const\s+(\w+)\s*=\s*(?:async\s+)?\([^)]*\)\s*=>',
-            r'(\w+)\s*:\s*(?:async\s+)?function\s*\(',
-            r'async\s+function\s+(\w+)\s*\('
-        ]
-        
-        for pattern in function_patterns:
-            matches = re.finditer(pattern, content, re.MULTILINE)
-            for match in matches:
+        for pattern in _JS_FUNCTION_RES:
+            if present is not None and pattern not in present:
+                continue
+            if pattern is _JS_PROPERTY_FUNCTION_RE:
+                names = _js_property_function_names(content)
+            else:
+                names = (match.group(1) for match in pattern.finditer(content))
+            for name in names:
                 info["functions"].append({
-                    "name": match.group(1),
+                    "name": name,
                     "type": "function"
                 })
         
         # Extract classes
-        class_matches = re.finditer(r'class\s+(\w+)(?:\s+extends\s+(\w+))?\s*\{', content, re.MULTILINE)
+        class_matches = _JS_CLASS_RE.finditer(content) if present is None or _JS_CLASS_RE in present else ()
         for match in class_matches:
             info["classes"].append({
                 "name": match.group(1),
@@ -276,7 +466,6 @@ class ContextAnalyzer:
         """Analyze generic file for basic information."""
         return {
             "type": "generic",
-            "content_preview": content[:300] + "..." if len(content) > 300 else content,
             "line_count": len(content.splitlines()),
             "size": len(content)
         }
@@ -285,11 +474,16 @@ class ContextAnalyzer:
         """Build dependency relationships between files."""
         dependencies = []
         
+        # Map each file stem to the first file (in order) that has it
+        stem_index = {}
+        for position, file_path in enumerate(files_info):
+            stem_index.setdefault(Path(file_path).stem, (position, file_path))
+        
         for file_path, file_info in files_info.items():
             imports = file_info.get("imports", [])
             for imp in imports:
                 # Try to resolve import to actual file
-                resolved_file = self._resolve_import(imp["name"], file_path, files_info)
+                resolved_file = self._resolve_import(imp["name"], stem_index)
                 if resolved_file:
                     dependencies.append({
                         "from": file_path,
@@ -300,17 +494,41 @@ class ContextAnalyzer:
         
         return dependencies
     
-    def _resolve_import(self, import_name: str, current_file: str, files_info: Dict[str, Dict[str, Any]]) -> Optional[str]:
+    def _resolve_import(self, import_name: str, stem_index: Dict[str, Tuple[int, str]]) -> Optional[str]:
         """Try to resolve an import to an actual file."""
-        # Simple resolution - look for files with matching names
-        for file_path in files_info.keys():
-            file_name = Path(file_path).stem
-            if file_name == import_name or import_name.endswith(file_name):
-                return file_path
-        return None
+        # Simple resolution - the earliest file whose stem ends the import name.
+        # Probing each suffix keeps this O(len(import_name)) instead of O(files).
+        best = None
+        for start in range(len(import_name)):
+            hit = stem_index.get(import_name[start:])
+            if hit and (best is None or hit[0] < best[0]):
+                best = hit
+        return best[1] if best else None
     
     def _detect_tech_stack(self, project_path: str) -> Dict[str, Any]:
         """Detect the technology stack of the project."""
+        # One directory listing instead of a stat per indicator file
+        try:
+            with os.scandir(project_path) as entries:
+                present = frozenset(
+                    entry.name for entry in entries if entry.name in self.TECH_STACK_INDICATORS
+                )
+        except OSError:
+            present = frozenset()
+        
+        package_json_path = os.path.join(project_path, "package.json")
+        package_json_mtime = None
+        if "package.json" in present:
+            try:
+                package_json_mtime = os.stat(package_json_path).st_mtime_ns
+            except OSError:
+                pass
+        
+        cache_key = (project_path, present, package_json_mtime)
+        cached = self._tech_stack_cache.get(cache_key)
+        if cached is not None:
+            return {k: sorted(v) for k, v in cached.items()}
+        
         tech_stack = {
             "languages": set(),
             "frameworks": set(),
@@ -318,84 +536,71 @@ class ContextAnalyzer:
             "package_managers": set()
         }
         
-        # Check for common files
-        indicators = {
-            "package.json": {"languages": ["javascript"], "package_managers": ["npm"]},
-            "requirements.txt": {"languages": ["python"], "package_managers": ["pip"]},
-            "Pipfile": {"languages": ["python"], "package_managers": ["pipenv"]},
-            "setup.py": {"languages": ["python"]},
-            "Dockerfile": {"tools": ["docker"]},
-            "docker-compose.yml": {"tools": ["docker-compose"]},
-            "yarn.lock": {"package_managers": ["yarn"]},
-            "pom.xml": {"languages": ["java"], "package_managers": ["maven"]},
-            "build.gradle": {"languages": ["java"], "package_managers": ["gradle"]},
-            "Cargo.toml": {"languages": ["rust"], "package_managers": ["cargo"]},
-            "go.mod": {"languages": ["go"], "package_managers": ["go"]},
-        }
-        
-        for file_name, stack_info in indicators.items():
-            file_path = os.path.join(project_path, file_name)
-            if os.path.exists(file_path):
-                for category, items in stack_info.items():
-                    tech_stack[category].update(items)
+        for file_name in present:
+            for category, items in self.TECH_STACK_INDICATORS[file_name].items():
+                tech_stack[category].update(items)
         
         # Check for framework indicators in package.json
-        package_json_path = os.path.join(project_path, "package.json")
-        if os.path.exists(package_json_path):
+        if "package.json" in present:
             try:
-                import json
-                with open(package_json_path, 'r') as f:
-                    package_data = json.load(f)
+                with open(package_json_path, 'rb') as f:
+                    package_data = _json_loads(f.read())
                 
                 dependencies = {**package_data.get("dependencies", {}), 
                               **package_data.get("devDependencies", {})}
+                dependency_names = [key.lower() for key in dependencies]
                 
-                framework_indicators = {
-                    "react": "React",
-                    "vue": "Vue.js",
-                    "angular": "Angular",
-                    "express": "Express.js",
-                    "next": "Next.js",
-                    "nuxt": "Nuxt.js",
-                    "svelte": "Svelte",
-                    "gatsby": "Gatsby",
-                    "webpack": "Webpack",
-                    "vite": "Vite",
-                    "typescript": "TypeScript"
-                }
-                
-                for dep, framework in framework_indicators.items():
-                    if any(dep in key.lower() for key in dependencies.keys()):
+                for dep, framework in self.FRAMEWORK_INDICATORS.items():
+                    if any(dep in key for key in dependency_names):
                         tech_stack["frameworks"].add(framework)
                         
             except Exception as e:
                 logger.error(f"Error reading package.json: {e}")
         
-        # Convert sets to lists for JSON serialization
-        return {k: list(v) for k, v in tech_stack.items()}
+        # Convert sets to sorted lists for JSON serialization; a fixed order
+        # keeps the AI prompt, and so its cache key, the same in every process
+        result = {k: sorted(v) for k, v in tech_stack.items()}
+        self._tech_stack_cache[cache_key] = result
+        return {k: sorted(v) for k, v in result.items()}
     
     def _get_file_structure(self, project_path: str, max_depth: int = 3) -> Dict[str, Any]:
         """Get project file structure."""
         structure = {}
         
         try:
-            for root, dirs, files in os.walk(project_path):
-                # Skip hidden directories and common ignore patterns
-                dirs[:] = [d for d in dirs if not d.startswith('.') and d not in ['node_modules', '__pycache__', 'venv', 'env']]
-                
-                level = root.replace(project_path, '').count(os.sep)
-                if level >= max_depth:
-                    dirs[:] = []
+            stack = [(project_path, 0)]
+            while stack:
+                current, level = stack.pop()
+                dirs = []
+                files = []
+                subdirs = []
+                try:
+                    with os.scandir(current) as entries:
+                        for entry in entries:
+                            name = entry.name
+                            if entry.is_dir():
+                                # Skip hidden directories and common ignore patterns
+                                if not name.startswith('.') and name not in self.IGNORED_DIRS:
+                                    dirs.append(name)
+                                    if not entry.is_symlink():
+                                        subdirs.append(entry.path)
+                            elif not name.startswith('.'):
+                                files.append(name)
+                except OSError:
                     continue
                 
-                rel_root = os.path.relpath(root, project_path)
+                rel_root = os.path.relpath(current, project_path)
                 if rel_root == '.':
                     rel_root = 'root'
                 
                 structure[rel_root] = {
                     "directories": dirs[:10],  # Limit to first 10
-                    "files": [f for f in files if not f.startswith('.')][:20]  # Limit to first 20
+                    "files": files[:20]  # Limit to first 20
                 }
+                
+                # Directories at max_depth are neither listed nor descended into
+                if level + 1 < max_depth:
+                    stack.extend((path, level + 1) for path in reversed(subdirs))
         
         except Exception as e:
             logger.error(f"Error getting file structure: {e}")
@@ -415,7 +620,8 @@ class ContextAnalyzer:
         Returns:
             Formatted context string for AI
         """
-        context = self.analyze_project_context(project_path, target_file)
+        # Previews are only built for the few related files that are shown
+        context = self.analyze_project_context(project_path, target_file, include_previews=False)
         
         context_parts = []
         
@@ -446,7 +652,7 @@ class ContextAnalyzer:
         if context["related_files"]:
             for file_path, file_info in list(context["related_files"].items())[:3]:
                 if file_path != os.path.relpath(target_file, project_path):
-                    preview = file_info.get("content_preview", "")
+                    preview = self._content_preview(file_info["type"], file_info.get("_content", ""))
                     if preview:
                         context_parts.append(f"Related file {file_path}:\n{preview[:400]}...")
         
@@ -1,4 +1,7 @@
+import functools
 import subprocess
+import hashlib
+import io
 import json
 import os
 import logging
@@ -6,181 +9,462 @@ import platform
 from pathlib import Path
 import tempfile
 import shutil
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import astroid
+    from pylint.lint import Run as PylintRun
+    from pylint.reporters.json_reporter import JSONReporter
+except ImportError:  # Fall back to the pylint executable
+    PylintRun = None
+
+try:
+    import orjson
+except ImportError:  # Optional speedup; stdlib json is used without it
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so handlers are shared
+_json_loads = orjson.loads if orjson else json.loads
+
+def _json_dumps(obj):
+    """Serialize obj to compact UTF-8 JSON bytes."""
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+@functools.lru_cache(maxsize=None)
+def _which(tool):
+    """Resolve a tool to an absolute path once so it can be run without a shell."""
+    return shutil.which(tool) or tool
+
+# Linter severities mapped onto the service's levels
+_PYLINT_SEVERITIES = {
+    'error': 'error',
+    'warning': 'warning',
+    'refactor': 'info',
+    'convention': 'style',
+    'info': 'info'
+}
+_ESLINT_SEVERITIES = {1: 'warning', 2: 'error'}
+
+# flake8, bandit and ESLint exit with 1 when they report findings; anything else is a failure
+_NORMAL_EXIT_CODES = (0, 1)
+# pylint's exit status is a bit mask; 1 marks a fatal message and 32 a usage error
+_PYLINT_FAILURE_BITS = 1 | 32
+
+# pylint keeps global linter and astroid state, so in-process runs are serialized
+_PYLINT_LOCK = threading.Lock()
+
+# Linter issues keyed by tool, file(s), content digest and config mtime
+_LINT_CACHE_SIZE = int(os.getenv('LINT_CACHE_SIZE', '4096'))
+_lint_cache = OrderedDict()
+_lint_cache_lock = threading.Lock()
+
+def _get_cached_lint(key):
+    """Return a copy of the cached issues for key, or None on a miss."""
+    with _lint_cache_lock:
+        issues = _lint_cache.get(key)
+        if issues is None:
+            return None
+        _lint_cache.move_to_end(key)
+    return [dict(issue) for issue in issues]
+
+def _store_lint(key, issues):
+    """Cache a copy of issues under key, evicting the least recently used entry."""
+    with _lint_cache_lock:
+        _lint_cache[key] = [dict(issue) for issue in issues]
+        _lint_cache.move_to_end(key)
+        while len(_lint_cache) > _LINT_CACHE_SIZE:
+            _lint_cache.popitem(last=False)
+
+# One ESLint worker per process, shared by every LinterService. A worker that
+# has not answered within ESLINT_SERVER_TIMEOUT seconds is killed.
+_eslint_server = None
+_eslint_server_lock = threading.Lock()
+_ESLINT_SERVER_TIMEOUT = float(os.getenv('ESLINT_SERVER_TIMEOUT', '120'))
+
+def _eslint_server_request(workspace, request):
+    """
+    Send a lint request to the ESLint worker, starting it if needed. Returns the
+    ESLint results, or None when the worker is unavailable, times out or reports
+    an error so the caller can fall back to the ESLint CLI.
+    """
+    global _eslint_server
+    script = workspace / 'eslint_server.js'
+    if not script.exists():
+        return None
+    
+    with _eslint_server_lock:
+        try:
+            if _eslint_server is None or _eslint_server.poll() is not None:
+                _eslint_server = subprocess.Popen(
+                    [_which('node'), str(script)],
+                    cwd=str(workspace),
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL
+                )
+                logger.info("Started ESLint worker")
+            server = _eslint_server
+            server.stdin.write(_json_dumps(request) + b'\n')
+            server.stdin.flush()
+            # Killing a wedged worker closes its stdout, which ends the read; a
+            # watchdog works on Windows pipes, where select() does not
+            watchdog = threading.Timer(_ESLINT_SERVER_TIMEOUT, server.kill)
+            watchdog.daemon = True
+            watchdog.start()
+            try:
+                line = server.stdout.readline()
+            finally:
+                watchdog.cancel()
+        except OSError as e:
+            logger.warning("ESLint worker unavailable: %s", e)
+            _eslint_server = None
+            return None
+        
+        if not line.endswith(b'\n'):
+            # Exited or killed by the watchdog; the next request starts a new one
+            server.kill()
+            server.wait()
+            _eslint_server = None
+            logger.warning("ESLint worker stopped responding (exit status %s)", server.returncode)
+            return None
+    
+    response = _json_loads(line)
+    if 'error' in response:
+        logger.warning("ESLint worker error: %s", response['error'])
+        return None
+    return response['results']
+
+# Linter configs and the ESLint workspace, resolved once per process
+_LINTERS_DIR = Path(__file__).resolve().parent.parent / 'linters'
+_LINTER_CONFIGS = ('.flake8', '.bandit', '.pylintrc', '.eslintrc.json', 'tsconfig.json')
+
 class LinterService:
     def __init__(self, repo_path):
         self.repo_path = Path(repo_path)
-        self.linter_config_path = Path(__file__).parent.parent / 'linters'
+        self.linter_config_path = _LINTERS_DIR
         
     def run_flake8(self, python_files):
-        """Run flake8 on Python files"""
+        """Run flake8 on Python files, returning the issues and whether it succeeded"""
         if not python_files:
-            return []
+            return [], True
             
+        try:
+            return self._run_per_file_cached('flake8', self._flake8, python_files, '.flake8')
+        except Exception as e:
+            logger.error("Flake8 execution failed: %s", e)
+            return [], False
+    
+    def _flake8(self, python_files):
+        """Return flake8's issues and whether it exited normally."""
         issues = []
         config_file = self.linter_config_path / '.flake8'
         
-        try:
-            cmd = ['flake8', '--config', str(config_file), '--format=json'] + python_files
-            result = subprocess.run(cmd, capture_output=True, text=True, cwd=self.repo_path)
-            
-            if result.stdout:
-                for line in result.stdout.strip().split('\n'):
-                    if line:
-                        try:
-                            data = json.loads(line)
-                            issues.append({
-                                'tool': 'flake8',
-                                'severity': 'error' if data['code'].startswith('E') else 'warning',
-                                'file': data['filename'],
-                                'line': data['line_number'],
-                                'column': data['column_number'],
-                                'code': data['code'],
-                                'message': data['text'],
-                                'suggestion': f"Fix {data['code']}: {data['text']}"
-                            })
-                        except json.JSONDecodeError:
-                            continue
-                            
-        except Exception as e:
-            logger.error(f"Flake8 execution failed: {e}")
-            
-        return issues
+        cmd = [_which('flake8'), '--config', str(config_file), '--format=json'] + python_files
+        # Raw bytes go straight to the JSON parser without a text decode pass
+        result = subprocess.run(cmd, capture_output=True, cwd=self.repo_path)
+        
+        if result.stdout:
+            for line in result.stdout.splitlines():
+                if line.strip():
+                    try:
+                        data = _json_loads(line)
+                        issues.append({
+                            'tool': 'flake8',
+                            'severity': 'error' if data['code'].startswith('E') else 'warning',
+                            'file': data['filename'],
+                            'line': data['line_number'],
+                            'column': data['column_number'],
+                            'code': data['code'],
+                            'message': data['text'],
+                            'suggestion': f"Fix {data['code']}: {data['text']}"
+                        })
+                    except json.JSONDecodeError:
+                        continue
+        
+        ok = result.returncode in _NORMAL_EXIT_CODES
+        if not ok:
+            logger.error("flake8 exited with status %s: %s", result.returncode,
+                         result.stderr.decode('utf-8', 'replace'))
+        return issues, ok
     
     def run_bandit(self, python_files):
-        """Run bandit security linter on Python files"""
+        """Run bandit security linter on Python files, returning the issues and whether it succeeded"""
         if not python_files:
-            return []
+            return [], True
             
+        try:
+            return self._run_per_file_cached('bandit', self._bandit, python_files, '.bandit')
+        except Exception as e:
+            logger.error("Bandit execution failed: %s", e)
+            return [], False
+    
+    def _bandit(self, python_files):
+        """Return bandit's issues and whether it exited normally."""
         issues = []
         config_file = self.linter_config_path / '.bandit'
         
-        try:
-            cmd = ['bandit', '-c', str(config_file), '-f', 'json'] + python_files
-            result = subprocess.run(cmd, capture_output=True, text=True, cwd=self.repo_path)
-            
-            if result.stdout:
-                data = json.loads(result.stdout)
-                for issue in data.get('results', []):
-                    issues.append({
-                        'tool': 'bandit',
-                        'severity': 'security',
-                        'file': issue['filename'],
-                        'line': issue['line_number'],
-                        'column': issue.get('col_offset', 0),
-                        'code': issue['test_id'],
-                        'message': issue['issue_text'],
-                        'suggestion': f"Security issue: {issue['issue_text']}"
-                    })
-                    
-        except Exception as e:
-            logger.error(f"Bandit execution failed: {e}")
-            
-        return issues
+        cmd = [_which('bandit'), '-c', str(config_file), '-f', 'json'] + python_files
+        result = subprocess.run(cmd, capture_output=True, cwd=self.repo_path)
+        
+        if result.stdout:
+            data = _json_loads(result.stdout)
+            for issue in data.get('results', []):
+                issues.append({
+                    'tool': 'bandit',
+                    'severity': 'security',
+                    'file': issue['filename'],
+                    'line': issue['line_number'],
+                    'column': issue.get('col_offset', 0),
+                    'code': issue['test_id'],
+                    'message': issue['issue_text'],
+                    'suggestion': f"Security issue: {issue['issue_text']}"
+                })
+        
+        ok = result.returncode in _NORMAL_EXIT_CODES
+        if not ok:
+            logger.error("bandit exited with status %s: %s", result.returncode,
+                         result.stderr.decode('utf-8', 'replace'))
+        return issues, ok
     
     def run_pylint(self, python_files):
-        """Run pylint on Python files"""
+        """Run pylint on Python files, returning the issues and whether it succeeded"""
         if not python_files:
-            return []
+            return [], True
             
+        try:
+            # Inference crosses files (imports, members), so only an unchanged batch is reused
+            return self._run_batch_cached('pylint', self._pylint, python_files, '.pylintrc')
+        except Exception as e:
+            logger.error("Pylint execution failed: %s", e)
+            return [], False
+    
+    def _pylint(self, python_files):
+        """Return pylint's issues and whether it exited normally."""
         issues = []
         config_file = self.linter_config_path / '.pylintrc'
         
+        if PylintRun is not None:
+            data, status = self._run_pylint_in_process(python_files, config_file)
+        else:
+            cmd = [_which('pylint'), '--rcfile', str(config_file), '--output-format=json'] + python_files
+            result = subprocess.run(cmd, capture_output=True, cwd=self.repo_path)
+            data = _json_loads(result.stdout) if result.stdout else []
+            status = result.returncode
+        
+        for issue in data:
+            issues.append({
+                'tool': 'pylint',
+                'severity': _PYLINT_SEVERITIES.get(issue['type'], 'info'),
+                'file': issue['path'],
+                'line': issue['line'],
+                'column': issue['column'],
+                'code': issue['symbol'],
+                'message': issue['message'],
+                'suggestion': f"Pylint {issue['type']}: {issue['message']}"
+            })
+        
+        ok = status >= 0 and not status & _PYLINT_FAILURE_BITS
+        if not ok:
+            logger.error("pylint exited with status %s", status)
+        return issues, ok
+    
+    def _file_digest(self, file_path):
+        """Return a digest of a file's bytes, or None if it cannot be read."""
         try:
-            cmd = ['pylint', '--rcfile', str(config_file), '--output-format=json'] + python_files
-            result = subprocess.run(cmd, capture_output=True, text=True, cwd=self.repo_path)
-            
-            if result.stdout:
-                data = json.loads(result.stdout)
-                for issue in data:
-                    severity_map = {
-                        'error': 'error',
-                        'warning': 'warning', 
-                        'refactor': 'info',
-                        'convention': 'style',
-                        'info': 'info'
-                    }
-                    
-                    issues.append({
-                        'tool': 'pylint',
-                        'severity': severity_map.get(issue['type'], 'info'),
-                        'file': issue['path'],
-                        'line': issue['line'],
-                        'column': issue['column'],
-                        'code': issue['symbol'],
-                        'message': issue['message'],
-                        'suggestion': f"Pylint {issue['type']}: {issue['message']}"
-                    })
-                    
-        except Exception as e:
-            logger.error(f"Pylint execution failed: {e}")
-            
-        return issues
+            with open(self.repo_path / file_path, 'rb') as f:
+                return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+        except OSError:
+            return None
+    
+    def _config_stamp(self, config_name):
+        """Return the config file's mtime so edits to it invalidate cached results."""
+        try:
+            return os.stat(self.linter_config_path / config_name).st_mtime_ns
+        except OSError:
+            return None
+    
+    def config_stamps(self):
+        """Return the mtimes of every linter config, for keys of results built on them."""
+        return tuple(self._config_stamp(config_name) for config_name in _LINTER_CONFIGS)
+    
+    def _run_per_file_cached(self, tool, runner, files, config_name):
+        """
+        Run a linter whose findings depend only on each file's own content,
+        reusing cached issues for files whose bytes are unchanged. Returns the
+        issues and whether the linter, if it ran, exited normally.
+        """
+        config_stamp = self._config_stamp(config_name)
+        results = {}
+        misses = []
+        for file_path in files:
+            digest = self._file_digest(file_path)
+            key = (tool, file_path, digest, config_stamp) if digest else None
+            cached = _get_cached_lint(key) if key else None
+            if cached is None:
+                misses.append((file_path, key))
+            else:
+                results[file_path] = cached
+        
+        unmatched = []
+        ok = True
+        if misses:
+            by_file = {os.path.normpath(file_path): [] for file_path, _ in misses}
+            issues, ok = runner([file_path for file_path, _ in misses])
+            for issue in issues:
+                by_file.get(os.path.normpath(str(issue.get('file', ''))), unmatched).append(issue)
+            # A failed run, or one with findings that could not be attributed
+            # to a file, would replay an incomplete result; don't keep it
+            cacheable = ok and not unmatched
+            for file_path, key in misses:
+                results[file_path] = by_file[os.path.normpath(file_path)]
+                if key and cacheable:
+                    _store_lint(key, results[file_path])
+        
+        return [issue for file_path in files for issue in results[file_path]] + unmatched, ok
+    
+    def _run_batch_cached(self, tool, runner, files, config_name):
+        """
+        Run a cross-file linter, reusing its result only when no file in the
+        batch changed. Returns the issues and whether the linter exited normally.
+        """
+        digests = tuple(self._file_digest(file_path) for file_path in files)
+        key = None
+        if None not in digests:
+            key = (tool, str(self.repo_path), tuple(zip(files, digests)), self._config_stamp(config_name))
+            cached = _get_cached_lint(key)
+            if cached is not None:
+                return cached, True
+        
+        issues, ok = runner(files)
+        if key and ok:
+            _store_lint(key, issues)
+        return issues, ok
+    
+    def _run_pylint_in_process(self, python_files, config_file):
+        """
+        Run pylint through its API, skipping interpreter start-up and the astroid
+        import on every call. Reported paths are mapped back to the paths passed
+        in. Returns the reported issues and pylint's exit status.
+        """
+        paths = {os.path.abspath(self.repo_path / f): f for f in python_files}
+        buffer = io.StringIO()
+        with _PYLINT_LOCK:
+            # Files may have changed since the last run; don't reuse their ASTs
+            astroid.MANAGER.clear_cache()
+            try:
+                run = PylintRun(['--rcfile', str(config_file)] + list(paths), reporter=JSONReporter(buffer), exit=False)
+                status = run.linter.msg_status
+            except SystemExit as e:
+                # Configuration errors exit even when exit=False is passed
+                status = e.code if isinstance(e.code, int) else 32
+        
+        # pylint reports paths relative to the process cwd when they lie under it
+        data = _json_loads(buffer.getvalue() or '[]')
+        for issue in data:
+            path = issue.get('path', '')
+            issue['path'] = paths.get(os.path.abspath(path), path)
+        return data, status
     
     def run_all_linters(self, files):
-        """Run all appropriate linters on the given files"""
+        """
+        Run all appropriate linters on the given files. Returns the issues and
+        whether every linter that had files to check ran successfully.
+        """
         if not files:
             logger.warning("No files provided for linting")
-            return []
+            return [], True
             
-        logger.info(f"Running linters on {len(files)} files")
-        python_files = [f for f in files if f.endswith(('.py',))]
-        js_files = [f for f in files if f.endswith(('.js', '.jsx', '.ts', '.tsx'))]
+        logger.info("Running linters on %d files", len(files))
+        # Single pass over the file list, bucketing by extension
+        python_files = []
+        js_files = []
+        buckets = {'py': python_files, 'js': js_files, 'jsx': js_files, 'ts': js_files, 'tsx': js_files}
+        for f in files:
+            dot = f.rfind('.')
+            bucket = buckets.get(f[dot + 1:]) if dot != -1 else None
+            if bucket is not None:
+                bucket.append(f)
 
         all_issues = []
+        complete = True
         
         # Log file type distribution
-        logger.info(f"Found {len(python_files)} Python files and {len(js_files)} JavaScript/TypeScript files")
+        logger.info("Found %d Python files and %d JavaScript/TypeScript files", len(python_files), len(js_files))
+        if not python_files and not js_files:
+            return all_issues, complete
 
         try:
-            # Run Python linters
-            if python_files:
-                logger.debug("Running Python linters...")
-                flake8_issues = self.run_flake8(python_files)
-                bandit_issues = self.run_bandit(python_files)
-                pylint_issues = self.run_pylint(python_files)
-                all_issues.extend(flake8_issues)
-                all_issues.extend(bandit_issues)
-                all_issues.extend(pylint_issues)
-                logger.info(f"Python linters found {len(flake8_issues) + len(bandit_issues) + len(pylint_issues)} issues")
+            # The linters are independent child processes, so run them side by side,
+            # one worker per linter that actually has files to check
+            max_workers = (3 if python_files else 0) + (1 if js_files else 0)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                python_futures = []
+                eslint_future = None
+                if python_files:
+                    logger.debug("Running Python linters...")
+                    python_futures = [
+                        executor.submit(self.run_flake8, python_files),
+                        executor.submit(self.run_bandit, python_files),
+                        executor.submit(self.run_pylint, python_files)
+                    ]
+                if js_files:
+                    logger.debug("Running ESLint...")
+                    eslint_future = executor.submit(self.run_eslint, js_files)
 
-            # Run JavaScript linters
-            if js_files:
-                logger.debug("Running ESLint...")
-                eslint_issues = self.run_eslint(js_files)
-                all_issues.extend(eslint_issues)
-                logger.info(f"ESLint found {len(eslint_issues)} issues")
-                
-            # Log summary
-            issue_types = {}
-            for issue in all_issues:
-                tool = issue.get('tool', 'unknown')
-                severity = issue.get('severity', 'unknown')
-                issue_types[f"{tool}.{severity}"] = issue_types.get(f"{tool}.{severity}", 0) + 1
+                # Collect in a fixed order so the report does not depend on timing
+                if python_futures:
+                    python_issues = []
+                    for future in python_futures:
+                        issues, ok = future.result()
+                        python_issues.extend(issues)
+                        complete = complete and ok
+                    all_issues.extend(python_issues)
+                    logger.info("Python linters found %d issues", len(python_issues))
+
+                if eslint_future is not None:
+                    eslint_issues, ok = eslint_future.result()
+                    complete = complete and ok
+                    all_issues.extend(eslint_issues)
+                    logger.info("ESLint found %d issues", len(eslint_issues))
                 
-            logger.info(f"Total issues found: {len(all_issues)}")
-            for issue_type, count in issue_types.items():
-                logger.info(f"  - {issue_type}: {count}")
+            # Log summary; the per-type tally is only built when INFO is enabled
+            logger.info("Total issues found: %d", len(all_issues))
+            if logger.isEnabledFor(logging.INFO):
+                issue_types = Counter(
+                    (issue.get('tool', 'unknown'), issue.get('severity', 'unknown'))
+                    for issue in all_issues
+                )
+                for (tool, severity), count in issue_types.items():
+                    logger.info("  - %s.%s: %s", tool, severity, count)
                 
         except Exception as e:
-            logger.error(f"Error during linting: {str(e)}", exc_info=True)
+            logger.error("Error during linting: %s", e, exc_info=True)
+            complete = False
         
-        return all_issues
+        return all_issues, complete
 
     def run_eslint(self, js_files):
-        """Run ESLint on JavaScript/TypeScript files - Windows-compatible implementation."""
+        """
+        Run ESLint on JavaScript/TypeScript files - Windows-compatible implementation.
+        Returns the issues and whether ESLint ran successfully.
+        """
         if not js_files:
             logger.debug("No JavaScript files to analyze with ESLint")
-            return []
+            return [], True
 
         if not shutil.which('npm'):
             logger.error("'npm' command not found. Skipping ESLint. Please install Node.js.")
-            return []
+            return [], False
 
-        logger.info(f"Starting ESLint analysis on {len(js_files)} JavaScript files")
-        logger.debug(f"Files to analyze: {', '.join(js_files[:5])}{'...' if len(js_files) > 5 else ''}")
+        logger.info("Starting ESLint analysis on %d JavaScript files", len(js_files))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Files to analyze: %s%s", ', '.join(js_files[:5]), '...' if len(js_files) > 5 else '')
         
         # Create a dedicated eslint workspace in linters folder
         eslint_workspace = self.linter_config_path / 'eslint_workspace'
@@ -228,6 +512,7 @@ class LinterService:
             logger.info("Updated package.json with React dependencies")
         
         issues = []
+        ok = False
         try:
             # Install ESLint and React plugins if not already installed or if package.json changed
             node_modules_path = eslint_workspace / 'node_modules'
@@ -235,16 +520,16 @@ class LinterService:
             
             if not node_modules_path.exists() or not react_app_config.exists():
                 logger.info("Installing ESLint with React support in workspace...")
+                # npm resolves to npm.cmd on Windows, which runs without a shell
                 result = subprocess.run(
-                    ['npm', 'install'], 
+                    [_which('npm'), 'install'], 
                     cwd=str(eslint_workspace), 
                     capture_output=True, 
-                    text=True,
-                    shell=True
+                    text=True
                 )
                 if result.returncode != 0:
-                    logger.error(f"npm install failed: {result.stderr}")
-                    return []
+                    logger.error("npm install failed: %s", result.stderr)
+                    return [], False
                 logger.info("ESLint with React support installed successfully")
 
             # Use Node.js directly to run ESLint (most reliable on Windows)
@@ -252,71 +537,94 @@ class LinterService:
             config_file = self.linter_config_path / '.eslintrc.json'
             
             if not eslint_script.exists():
-                logger.error(f"ESLint script not found at {eslint_script}")
-                return []
-            
-            # Build command using node directly - use relative paths from repo root
-            # Use --no-eslintrc to ignore user's config and force our config
-            cmd = [
-                'node',
-                str(eslint_script),
-                '--no-eslintrc',
-                '--config', str(config_file),
-                '--format', 'json'
-            ] + js_files  # Use relative paths as passed in
+                logger.error("ESLint script not found at %s", eslint_script)
+                return [], False
             
-            logger.info(f"Running ESLint command: {' '.join(cmd[:5])}... (truncated)")
+            # Prefer the long-lived worker; it keeps Node, ESLint and its plugins loaded
+            data = _eslint_server_request(eslint_workspace, {
+                'cwd': str(self.repo_path),
+                'config': str(config_file),
+                'files': js_files
+            })
             
-            # Run ESLint
-            result = subprocess.run(
-                cmd,
-                cwd=str(self.repo_path),
-                capture_output=True,
-                text=True,
-                shell=True
-            )
+            if data is None:
+                data = self._run_eslint_cli(eslint_script, config_file, js_files)
             
-            logger.info(f"ESLint completed with return code: {result.returncode}")
-            
-            # Parse results (ESLint returns non-zero for linting issues, which is normal)
-            if result.stdout:
-                try:
-                    data = json.loads(result.stdout)
-                    for file_result in data:
-                        file_path = Path(file_result['filePath'])
-                        try:
-                            relative_path = file_path.relative_to(self.repo_path)
-                        except ValueError:
-                            # If relative_to fails, use the filename
-                            relative_path = file_path.name
-                        
-                        for issue in file_result.get('messages', []):
-                            severity_map = {1: 'warning', 2: 'error'}
-                            issues.append({
-                                'tool': 'eslint',
-                                'severity': severity_map.get(issue['severity'], 'info'),
-                                'file': str(relative_path),
-                                'line': issue.get('line', 1),
-                                'column': issue.get('column', 1),
-                                'code': issue.get('ruleId', 'unknown'),
-                                'message': issue['message'],
-                                'suggestion': f"ESLint: {issue['message']}"
-                            })
-                    
-                    logger.info(f"ESLint found {len(issues)} issues")
-                    
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse ESLint JSON output: {e}")
-                    logger.debug(f"ESLint stdout: {result.stdout[:500]}")
-            else:
-                logger.info("ESLint completed with no output")
-            
-            if result.stderr:
-                logger.warning(f"ESLint stderr: {result.stderr}")
+            if data is not None:
+                issues = self._parse_eslint_results(data)
+                ok = True
+                logger.info("ESLint found %d issues", len(issues))
 
         except Exception as e:
-            logger.error(f"ESLint execution failed: {e}")
+            logger.error("ESLint execution failed: %s", e)
             import traceback
             logger.debug(traceback.format_exc())
         
+        return issues, ok
+
+    def _run_eslint_cli(self, eslint_script, config_file, js_files):
+        """Run ESLint as a one-off Node process and return its parsed JSON output."""
+        # Build command using node directly - use relative paths from repo root
+        # Use --no-eslintrc to ignore user's config and force our config
+        cmd = [
+            _which('node'),
+            str(eslint_script),
+            '--no-eslintrc',
+            '--config', str(config_file),
+            '--format', 'json'
+        ] + js_files  # Use relative paths as passed in
+        
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Running ESLint command: %s... (truncated)", ' '.join(cmd[:5]))
+        
+        # Run ESLint; no shell, so file names are never interpreted by cmd.exe or sh
+        result = subprocess.run(
+            cmd,
+            cwd=str(self.repo_path),
+            capture_output=True
+        )
+        
+        logger.info("ESLint completed with return code: %s", result.returncode)
+        
+        if result.stderr:
+            logger.warning("ESLint stderr: %s", result.stderr.decode('utf-8', 'replace'))
+        
+        # Status 2 means ESLint itself failed, e.g. on a bad config
+        if result.returncode not in _NORMAL_EXIT_CODES:
+            logger.error("ESLint exited with status %s", result.returncode)
+            return None
+        
+        # Parse results (ESLint returns non-zero for linting issues, which is normal)
+        if not result.stdout:
+            logger.info("ESLint completed with no output")
+            return None
+        try:
+            return _json_loads(result.stdout)
+        except json.JSONDecodeError as e:
+            logger.error("Failed to parse ESLint JSON output: %s", e)
+            logger.debug("ESLint stdout: %s", result.stdout[:500].decode('utf-8', 'replace'))
+            return None
+
+    def _parse_eslint_results(self, data):
+        """Convert ESLint JSON results into issue dictionaries."""
+        issues = []
+        for file_result in data:
+            file_path = Path(file_result['filePath'])
+            try:
+                relative_path = str(file_path.relative_to(self.repo_path))
+            except ValueError:
+                # If relative_to fails, use the filename
+                relative_path = file_path.name
+            
+            for issue in file_result.get('messages', ()):
+                issues.append({
+                    'tool': 'eslint',
+                    'severity': _ESLINT_SEVERITIES.get(issue['severity'], 'info'),
+                    'file': relative_path,
+                    'line': issue.get('line', 1),
+                    'column': issue.get('column', 1),
+                    'code': issue.get('ruleId', 'unknown'),
+                    'message': issue['message'],
+                    'suggestion': f"ESLint: {issue['message']}"
+                })
         return issues
@@ -3,12 +3,14 @@ Simplified model configuration for Shard AI Review Service.
 Strict GPU mode (RTX 3050) – no CPU fallback.
 """
 
+import gc
 import logging
+import mmap
 import os
-import sys
-import platform
-import subprocess
-from typing import Dict, Optional, Any
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Any, Union
 from dataclasses import dataclass
 from enum import Enum
 
@@ -22,6 +24,19 @@ class ModelType(Enum):
     MISTRAL_7B = "mistral_7b"
     FALCON_7B = "falcon_7b"
 
+# Service root (ai-review/); model paths in the configs are relative to it
+_SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# llama.cpp `general.file_type` values for unquantized weights
+_UNQUANTIZED_FILE_TYPES = {0: "F32", 1: "F16", 32: "BF16"}
+
+# ggml tensor types accepted for the KV cache (AI_MODEL_KV_CACHE_TYPE)
+_KV_CACHE_TYPES = {"f16": 1, "q4_0": 2, "q8_0": 8, "bf16": 30}
+
+def _as_model_type(model_type: Union[str, ModelType]) -> ModelType:
+    """Return model_type as a ModelType, converting from its string value if needed."""
+    return model_type if isinstance(model_type, ModelType) else ModelType(model_type)
+
 @dataclass
 class ModelConfig:
     name: str
@@ -31,6 +46,7 @@ class ModelConfig:
     n_batch: int
     temperature: float
     max_tokens: int
+    n_ubatch: int = 512  # Physical prefill batch; clamped to n_batch
 
 class ModelManager:
     """Strict GPU-only model manager with lazy initialization."""
@@ -38,7 +54,12 @@ class ModelManager:
     def __init__(self):
         self.strict_gpu_only = True  # Enforce GPU-only mode
         self.model_configs = self._initialize_model_configs()
-        self._loaded_models = {}  # Cache for loaded models
+        # Loaded models, least recently used first. Runners only hold weak
+        # references, so evicting a model here releases its VRAM.
+        self._loaded_models: "OrderedDict[ModelType, Any]" = OrderedDict()
+        self.max_loaded = max(1, int(os.getenv('AI_MAX_LOADED_MODELS', '1')))
+        self._load_lock = threading.Lock()
+        self._gpu_available = None  # Cached result of the CuPy probe
 
     def _initialize_model_configs(self) -> Dict[ModelType, ModelConfig]:
         return {
@@ -47,7 +68,7 @@ class ModelManager:
                 model_path="models/deepseek-coder-6.7b-instruct.Q4_K_M.gguf",
                 context_length=1024,      
                 gpu_layers=24,            
-                n_batch=256,              
+                n_batch=512,              # The KV cache at 1k ctx is small enough for a full prefill batch
                 temperature=0.2,
                 max_tokens=1000
             ),
@@ -65,7 +86,7 @@ class ModelManager:
                 model_path="models/codellama-7b-instruct.Q3_K_M.gguf",
                 context_length=1024,      
                 gpu_layers=28,            
-                n_batch=64,
+                n_batch=256,
                 temperature=0.1,
                 max_tokens=1200
             ),
@@ -98,37 +119,67 @@ class ModelManager:
             )
         }
 
-    def get_model_config(self, model_type: str) -> Optional[ModelConfig]:
+    def get_model_config(self, model_type: Union[str, ModelType]) -> Optional[ModelConfig]:
         try:
-            model_enum = ModelType(model_type)
+            model_enum = _as_model_type(model_type)
             return self.model_configs.get(model_enum)
         except ValueError:
             return None
 
-    def get_loaded_model(self, model_type: str):
+    def get_loaded_model(self, model_type: Union[str, ModelType]):
         try:
-            model_enum = ModelType(model_type)
-            if model_enum in self._loaded_models:
-                logger.info(f"Using cached model: {model_enum.value}")
-                return self._loaded_models[model_enum]
-
-            model_config = self.model_configs.get(model_enum)
-            if not model_config:
-                logger.error(f"No configuration found for model: {model_type}")
-                return None
+            model_enum = _as_model_type(model_type)
+            # Already loaded: a plain dict read is atomic, no lock needed
+            model = self._loaded_models.get(model_enum)
+            if model is not None:
+                self._touch(model_enum)
+                return model
+            # Serialize loads so concurrent callers never load the same model twice
+            with self._load_lock:
+                if model_enum in self._loaded_models:
+                    logger.info(f"Using cached model: {model_enum.value}")
+                    self._touch(model_enum)
+                    return self._loaded_models[model_enum]
+
+                model_config = self.model_configs.get(model_enum)
+                if not model_config:
+                    logger.error(f"No configuration found for model: {model_type}")
+                    return None
+
+                # Make room in VRAM before loading another model
+                self._evict_to(self.max_loaded - 1)
 
-            logger.info(f"Loading model on demand: {model_config.name}")
-            loaded_model = self._load_model(model_config)
+                logger.info(f"Loading model on demand: {model_config.name}")
+                loaded_model = self._load_model(model_config)
 
-            if loaded_model:
-                self._loaded_models[model_enum] = loaded_model
-                logger.info(f"Successfully loaded and cached model: {model_enum.value}")
+                if loaded_model:
+                    self._loaded_models[model_enum] = loaded_model
+                    logger.info(f"Successfully loaded and cached model: {model_enum.value}")
 
-            return loaded_model
+                return loaded_model
         except ValueError:
             logger.error(f"Invalid model type: {model_type}")
             return None
 
+    def _touch(self, model_enum: ModelType) -> None:
+        """Mark a loaded model as most recently used."""
+        try:
+            self._loaded_models.move_to_end(model_enum)
+        except KeyError:  # Evicted by a concurrent load
+            pass
+
+    def _evict_to(self, limit: int) -> None:
+        """Drop least recently used models until at most limit remain. Needs _load_lock."""
+        evicted = 0
+        while len(self._loaded_models) > limit:
+            model_enum, _ = self._loaded_models.popitem(last=False)
+            logger.info(f"Evicted model to free VRAM: {model_enum.value}")
+            evicted += 1
+        if evicted:
+            # Runners only hold weak references, so the last strong one is gone
+            # unless an analysis is in flight; collect any cycles now
+            gc.collect()
+
     def _load_model(self, model_config: ModelConfig):
         try:
             from llama_cpp import Llama
@@ -138,27 +189,55 @@ class ModelManager:
                 logger.error("GPU not available. Cannot run models without NVIDIA GPU.")
                 return None
 
-            model_path = os.path.join(os.path.dirname(__file__), '..', model_config.model_path)
+            model_path = os.path.join(_SERVICE_DIR, model_config.model_path)
             if not os.path.exists(model_path):
                 logger.error(f"Model file not found at {model_path}")
                 return None
 
             logger.info(f"Loading {model_config.name} on RTX 3050")
 
-            model = Llama(
-                model_path=model_path,
-                n_ctx=model_config.context_length,
-                n_gpu_layers=model_config.gpu_layers,
-                n_batch=model_config.n_batch,
-                gpu_id=1,              # Hardcoded GPU index
-                verbose=False,
-                use_mlock=True,
-                use_mmap=True,
-                n_threads=1,
-                f16_kv=True,
-                offload_kv=False,
-                flash_attn=True
-            )
+            # AI_MODEL_GPU_LAYERS overrides the per-model setting; -1 offloads every layer
+            gpu_layers = int(os.getenv('AI_MODEL_GPU_LAYERS', model_config.gpu_layers))
+
+            # BF16 keeps F32's exponent range at F16's size; the quantized
+            # types (q8_0, q4_0) read fewer bytes per token but are opt-in
+            kv_cache_type = os.getenv('AI_MODEL_KV_CACHE_TYPE', 'bf16').lower()
+            if kv_cache_type not in _KV_CACHE_TYPES:
+                logger.warning(f"Unknown KV cache type '{kv_cache_type}', using f16")
+                kv_cache_type = 'f16'
+
+            def load(cache_type: str):
+                return Llama(
+                    model_path=model_path,
+                    n_ctx=model_config.context_length,
+                    n_gpu_layers=gpu_layers,
+                    n_batch=model_config.n_batch,
+                    n_ubatch=min(model_config.n_ubatch, model_config.n_batch),
+                    gpu_id=1,              # Hardcoded GPU index
+                    verbose=False,
+                    # mlock needs RLIMIT_MEMLOCK headroom for the whole model; opt-in only
+                    use_mlock=os.getenv('AI_MODEL_MLOCK', '0') == '1',
+                    use_mmap=True,
+                    n_threads=1,
+                    offload_kqv=True,      # Keep the KV cache in VRAM next to the offloaded layers
+                    type_k=_KV_CACHE_TYPES[cache_type],
+                    type_v=_KV_CACHE_TYPES[cache_type],  # Quantized V needs flash_attn
+                    logits_all=False,      # Only the last token's logits are sampled
+                    flash_attn=True
+                )
+
+            try:
+                model = load(kv_cache_type)
+            except Exception as e:
+                if kv_cache_type == 'f16':
+                    raise
+                # Builds or GPUs without flash attention (or BF16 support)
+                # reject these cache types; every build accepts f16
+                logger.warning(f"Loading with a {kv_cache_type} KV cache failed ({e}), retrying with f16")
+                model = load('f16')
+
+            self._warn_if_unquantized(model, model_config)
+            self._prefault_model_file(model_path)
 
             logger.info(f"{model_config.name} loaded successfully on RTX 3050")
             return model
@@ -170,6 +249,40 @@ class ModelManager:
             logger.error(f"Failed to load model {model_config.name}: {e}")
             return None
 
+    def _prefault_model_file(self, model_path: str) -> None:
+        """
+        Pull the whole GGUF into the page cache now, so the mmap'd weights
+        don't fault in from disk during the first inference.
+        """
+        start = time.perf_counter()
+        try:
+            with open(model_path, 'rb') as f:
+                if hasattr(os, 'posix_fadvise'):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if hasattr(mmap, 'MADV_WILLNEED'):
+                        mm.madvise(mmap.MADV_WILLNEED)
+                    # Touch one byte per page
+                    for offset in range(0, len(mm), mmap.PAGESIZE):
+                        mm[offset]
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not prefault {model_path}: {e}")
+            return
+        logger.info(f"Prefaulted model file in {time.perf_counter() - start:.2f}s")
+
+    def _warn_if_unquantized(self, model, model_config: ModelConfig) -> None:
+        """Warn when a GGUF holds F32/F16/BF16 weights, which llama.cpp may keep on the CPU."""
+        try:
+            file_type = int(model.metadata.get('general.file_type', -1))
+        except (AttributeError, TypeError, ValueError):
+            return
+        if file_type in _UNQUANTIZED_FILE_TYPES:
+            logger.warning(
+                f"{model_config.name} is not quantized ({_UNQUANTIZED_FILE_TYPES[file_type]}); "
+                "convert it with `llama-quantize <model>.gguf <model>.Q4_K_M.gguf Q4_K_M` "
+                "so every layer fits on the GPU"
+            )
+
     def list_available_models(self) -> Dict[str, Dict[str, Any]]:
         models_info = {}
         for model_type, config in self.model_configs.items():
@@ -181,29 +294,58 @@ class ModelManager:
             }
         return models_info
 
-    def unload_model(self, model_type: str) -> bool:
+    def unload_model(self, model_type: Union[str, ModelType]) -> bool:
         try:
-            model_enum = ModelType(model_type)
-            if model_enum in self._loaded_models:
-                del self._loaded_models[model_enum]
-                logger.info(f"Unloaded model: {model_type}")
-                return True
-            return False
+            model_enum = _as_model_type(model_type)
+            with self._load_lock:
+                model = self._loaded_models.pop(model_enum, None)
+            if model is None:
+                return False
+            self._close_model(model)
+            logger.info(f"Unloaded model: {model_type}")
+            return True
         except ValueError:
             return False
 
     def unload_all_models(self):
-        count = len(self._loaded_models)
-        self._loaded_models.clear()
-        logger.info(f"Unloaded {count} models from memory")
+        with self._load_lock:
+            models = list(self._loaded_models.values())
+            self._loaded_models.clear()
+        for model in models:
+            self._close_model(model)
+        logger.info(f"Unloaded {len(models)} models from memory")
+
+    @staticmethod
+    def _close_model(model) -> None:
+        """Release the model's GPU memory now instead of at garbage collection."""
+        close = getattr(model, 'close', None)  # Only newer llama_cpp releases have close()
+        if close is None:
+            return
+        try:
+            close()
+        except Exception as e:
+            logger.warning(f"Failed to close model cleanly: {e}")
 
     def check_gpu_availability(self) -> bool:
-        """Check if a CUDA GPU is available using CuPy."""
+        """Check if a CUDA GPU is available using CuPy. The result is cached."""
+        if self._gpu_available is None:
+            self._gpu_available = self._probe_gpu()
+        return self._gpu_available
+
+    def invalidate_gpu_cache(self) -> None:
+        """Forget the cached GPU probe so the next check runs it again."""
+        self._gpu_available = None
+
+    def _probe_gpu(self) -> bool:
         try:
             import cupy as cp
-            name = cp.cuda.runtime.getDeviceProperties(0)["name"].decode()
-            logger.info(f"SUCCESS: Found NVIDIA GPU via CuPy: {name}")
-            return True
+            device_count = cp.cuda.runtime.getDeviceCount()
+            if device_count > 0:
+                logger.info(f"SUCCESS: Found {device_count} NVIDIA GPU(s) via CuPy")
+                if logger.isEnabledFor(logging.DEBUG):
+                    name = cp.cuda.runtime.getDeviceProperties(0)["name"].decode()
+                    logger.debug(f"GPU 0: {name}")
+                return True
         except ImportError:
             logger.error("CuPy not installed. It is required for GPU operations.")
         except Exception as e:
@@ -1,38 +1,450 @@
+import atexit
+import functools
+import hashlib
 import json
 import os
 import re
 import logging
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate, islice
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Union
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Dict, Any, Optional, Tuple, Union
 from .model_config import model_manager, ModelType, ModelConfig
 from .context_analyzer import context_analyzer
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='[%(asctime)s] %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('ai_analysis.log')
-    ]
-)
+try:
+    import orjson
+except ImportError:  # Optional speedup; stdlib json is used without it
+    orjson = None
+
+try:
+    import ahocorasick
+except ImportError:  # Optional speedup; substring scans are used without it
+    ahocorasick = None
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so handlers are shared
+_json_loads = orjson.loads if orjson else json.loads
+
+# Configure logging. Records are only queued on the calling thread; a listener
+# thread owns the console and file handlers, so analysis never waits on disk.
+# Like basicConfig, this leaves an already configured root logger alone.
+if not logging.getLogger().handlers:
+    _log_formatter = logging.Formatter('[%(asctime)s] %(name)s - %(levelname)s - %(message)s')
+    _log_handlers = [logging.StreamHandler(), logging.FileHandler('ai_analysis.log')]
+    for _handler in _log_handlers:
+        _handler.setFormatter(_log_formatter)
+    _log_queue = queue.Queue(-1)
+    _log_listener = QueueListener(_log_queue, *_log_handlers)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+    _queue_handler = QueueHandler(_log_queue)
+    # Only merge args here; the listener's handlers apply the full format
+    _queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
 logger = logging.getLogger(__name__)
 
+# llama.cpp contexts are not thread-safe; serialize inference across runners
+_MODEL_LOCK = threading.Lock()
+
+# Message of the placeholder issue reported when AI analysis of a file fails
+AI_FAILURE_MESSAGE = 'AI analysis failed. Check the logs for details.'
+
+# Validated AI issues keyed by model + prompt digest. The prompt embeds the code,
+# its path and the project context. Bump the version when decoding settings or
+# issue post-processing change so stale results are not served.
+_AI_CACHE_VERSION = 1
+_AI_CACHE_SIZE = int(os.getenv('AI_CACHE_SIZE', '512'))
+_ai_cache: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+_ai_cache_lock = threading.Lock()
+
+def _prompt_key(prompt: str, model_type: ModelType) -> str:
+    """Build a cache key from the cache version, model type and a digest of the prompt."""
+    digest = hashlib.blake2b(prompt.encode('utf-8', 'ignore'), digest_size=16).hexdigest()
+    return f"{_AI_CACHE_VERSION}:{model_type.value}:{digest}"
+
+# Optional second tier on disk, shared by every worker process and kept across
+# restarts. Enabled by pointing AI_CACHE_DB at an SQLite file; SQLite's own
+# locking makes concurrent workers safe. Entries expire after AI_CACHE_TTL
+# seconds and the oldest are evicted beyond AI_CACHE_DB_SIZE rows.
+_AI_CACHE_DB = os.getenv('AI_CACHE_DB', '')
+_AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL', str(24 * 3600)))
+_AI_CACHE_DB_SIZE = int(os.getenv('AI_CACHE_DB_SIZE', '2000'))
+_ai_cache_db = threading.local()
+
+def _get_cache_db() -> sqlite3.Connection:
+    """Return this thread's connection to the persistent AI cache."""
+    conn = getattr(_ai_cache_db, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(_AI_CACHE_DB, timeout=5)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS ai_issues '
+            '(key TEXT PRIMARY KEY, issues BLOB NOT NULL, created REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ai_issues_created ON ai_issues (created)')
+        _ai_cache_db.conn = conn
+    return conn
+
+def _load_persisted_ai_issues(key: str) -> Optional[List[Dict[str, Any]]]:
+    """Return unexpired issues stored on disk for key, or None."""
+    try:
+        row = _get_cache_db().execute(
+            'SELECT issues FROM ai_issues WHERE key = ? AND created >= ?',
+            (key, time.time() - _AI_CACHE_TTL)
+        ).fetchone()
+        return _json_loads(row[0]) if row else None
+    except (sqlite3.Error, OSError, ValueError) as e:
+        # The disk tier is only an optimization; treat any failure as a miss
+        logger.warning("Persistent AI cache read failed: %s", e)
+        return None
+
+def _persist_ai_issues(key: str, issues: List[Dict[str, Any]]) -> None:
+    """Store issues on disk under key and trim expired and excess entries."""
+    data = orjson.dumps(issues) if orjson else json.dumps(issues).encode('utf-8')
+    now = time.time()
+    try:
+        with _get_cache_db() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO ai_issues (key, issues, created) VALUES (?, ?, ?)',
+                (key, data, now)
+            )
+            conn.execute('DELETE FROM ai_issues WHERE created < ?', (now - _AI_CACHE_TTL,))
+            conn.execute(
+                'DELETE FROM ai_issues WHERE key IN '
+                '(SELECT key FROM ai_issues ORDER BY created DESC LIMIT -1 OFFSET ?)',
+                (_AI_CACHE_DB_SIZE,)
+            )
+    except (sqlite3.Error, OSError) as e:
+        logger.warning("Persistent AI cache write failed: %s", e)
+
+def _get_cached_ai_issues(key: str) -> Optional[List[Dict[str, Any]]]:
+    """Return a copy of the cached AI issues for key, or None on a miss."""
+    with _ai_cache_lock:
+        issues = _ai_cache.get(key)
+        if issues is not None:
+            _ai_cache.move_to_end(key)
+    if issues is None:
+        if not _AI_CACHE_DB:
+            return None
+        issues = _load_persisted_ai_issues(key)
+        if issues is None:
+            return None
+        _remember_ai_issues(key, issues)
+    return [dict(issue) for issue in issues]
+
+def _remember_ai_issues(key: str, issues: List[Dict[str, Any]]) -> None:
+    """Keep a copy of issues in memory, evicting the least recently used entry."""
+    with _ai_cache_lock:
+        _ai_cache[key] = [dict(issue) for issue in issues]
+        _ai_cache.move_to_end(key)
+        while len(_ai_cache) > _AI_CACHE_SIZE:
+            _ai_cache.popitem(last=False)
+
+def _store_ai_issues(key: str, issues: List[Dict[str, Any]]) -> None:
+    """Cache a copy of issues under key in memory and, if enabled, on disk."""
+    _remember_ai_issues(key, issues)
+    if _AI_CACHE_DB:
+        _persist_ai_issues(key, issues)
+
+# Debug dumps of raw responses are written by one background thread so disk I/O
+# stays off the analysis path
+_RESPONSE_LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
+_response_queue: "queue.Queue[Tuple[str, bytes]]" = queue.Queue()
+_response_writer: Optional[threading.Thread] = None
+_response_writer_lock = threading.Lock()
+
+def _write_responses() -> None:
+    """Write queued (file name, bytes) responses to the log directory, forever."""
+    try:
+        os.makedirs(_RESPONSE_LOG_DIR, exist_ok=True)
+    except OSError as e:
+        logger.error("Failed to create response log directory: %s", e)
+    while True:
+        file_name, data = _response_queue.get()
+        file_path = os.path.join(_RESPONSE_LOG_DIR, file_name)
+        try:
+            with open(file_path, 'wb') as f:
+                f.write(data)
+            logger.info("Saved AI response to %s", file_path)
+        except Exception as e:
+            logger.error("Failed to save AI response: %s", e)
+
+def _queue_response(file_name: str, response_text: str) -> None:
+    """Hand a response to the writer thread, starting it on first use."""
+    global _response_writer
+    if _response_writer is None:
+        with _response_writer_lock:
+            if _response_writer is None:
+                _response_writer = threading.Thread(
+                    target=_write_responses, name='ai-response-writer', daemon=True
+                )
+                _response_writer.start()
+    _response_queue.put((file_name, response_text.encode('utf-8')))
+
+# Static heads of the review prompts. Their evaluated state is kept per model
+# so only the file-specific remainder of each prompt needs a prefill. Anything
+# that varies per file (path, context, code) must come after them, code last.
+_JS_PROMPT_PRELUDE = """[INST] <<SYS>>
+You are an advanced JavaScript/TypeScript code analyzer. Your task is to thoroughly analyze code and return a JSON array of issues with detailed information.
+
+CRITICAL RULES:
+1. Output MUST be a valid JSON array only - no other text or explanations.
+2. For each issue, provide:
+   - `severity`: "error" (prevents execution), "warning" (potential issue), or "security" (vulnerability)
+   - `line`: Line number where issue occurs (1-based)
+   - `message`: Concise description of the issue
+   - `suggestion`: Specific code fix or recommendation
+   - `category`: One of ["syntax", "type", "security", "performance", "best-practice"]
+3. Always validate JSON syntax before returning.
+
+ANALYSIS PRIORITY:
+1. CRITICAL: Syntax errors, missing imports, undefined variables
+2. SECURITY: XSS, injection, auth issues, sensitive data exposure
+3. ERRORS: Runtime errors, type mismatches, invalid operations
+4. WARNINGS: Code smells, anti-patterns, deprecated APIs
+
+IGNORE:
+- Code style issues (formatting, naming conventions)
+- Comments and documentation
+- Test files (*.test.js, *.spec.js)
+- Third-party library code in node_modules
+
+<</SYS>>
+
+"""
+_PY_PROMPT_PRELUDE = """[INST]
+Analyze the following Python code for security vulnerabilities and critical errors.
+
+**Instructions:**
+1.  Identify critical errors and security vulnerabilities.
+2.  Your response MUST be a valid JSON array.
+3.  Each object in the array must contain these keys:
+    - `line` (integer): The line number of the issue.
+    - `severity` (string): "error", "warning", or "security".
+    - `message` (string): A concise description of the issue.
+    - `suggestion` (string): A specific recommendation for a fix.
+4.  Do NOT include explanations, comments, or any text outside the JSON array.
+
+**Example of a valid response:**
+[
+  {
+    "line": 10,
+    "severity": "security",
+    "message": "Use of 'eval' is a security risk.",
+    "suggestion": "Replace 'eval' with a safer alternative like 'ast.literal_eval' or refactor the logic to avoid dynamic execution."
+  }
+]
+
+"""
+_PROMPT_PRELUDES = (_JS_PROMPT_PRELUDE, _PY_PROMPT_PRELUDE)
+_prelude_states: "weakref.WeakKeyDictionary[Any, Dict[str, Tuple[List[int], Any]]]" = weakref.WeakKeyDictionary()
+
+# GBNF grammar for the issue array the prompts ask for; decoding can only
+# produce well-formed issues and has to end once the array is closed
+_ISSUE_GRAMMAR = r"""
+root     ::= ws "[" ws ( issue ( ws "," ws issue )* )? ws "]"
+issue    ::= "{" ws "\"line\"" ws ":" ws integer ws "," ws "\"severity\"" ws ":" ws severity ws "," ws "\"message\"" ws ":" ws string ws "," ws "\"suggestion\"" ws ":" ws string ( ws "," ws "\"category\"" ws ":" ws string )? ws "}"
+severity ::= "\"error\"" | "\"warning\"" | "\"security\""
+integer  ::= [0-9] [0-9]? [0-9]? [0-9]? [0-9]? [0-9]?
+string   ::= "\"" ( [^"\\\x7F\x00-\x1F] | "\\" ( ["\\/bfnrt] | "u" [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] ) )* "\""
+ws       ::= [ \t\n]*
+"""
+_issue_grammar = None
+_issue_grammar_failed = False
+
+# Output budget: a base plus room for roughly one issue per 20 lines of code
+_BASE_OUTPUT_TOKENS = 128
+_TOKENS_PER_ISSUE = 128
+
+def _get_issue_grammar():
+    """Compile the issue grammar once; None if llama.cpp grammars are unavailable."""
+    global _issue_grammar, _issue_grammar_failed
+    if _issue_grammar is None and not _issue_grammar_failed:
+        try:
+            from llama_cpp import LlamaGrammar
+            _issue_grammar = LlamaGrammar.from_string(_ISSUE_GRAMMAR, verbose=False)
+        except Exception as e:
+            logger.warning("Grammar-constrained decoding disabled: %s", e)
+            _issue_grammar_failed = True
+    return _issue_grammar
+
+# Simple pattern matching for common anti-patterns: (message, pattern, needs a
+# leading word boundary). Every pattern starts with a literal so `re` can use its
+# fast substring search; a leading \b would disable it, so the boundary is
+# checked by hand. Case is folded by lowercasing ASCII sources once.
+_LINT_RULES = tuple(
+    (message, re.compile(pattern), re.compile(pattern, re.IGNORECASE), word_start)
+    for message, pattern, word_start in (
+        ("Use of eval", r"eval\s*\(", True),
+        ("Use of pickle", r"import\s+pickle|from\s+pickle\s+import", False),
+        ("Hardcoded secret (heuristic)", r"secret|password|key", False),
+    )
+)
+
+# Recovery for chatty model output: the C scanner behind json.loads decodes a
+# value at an offset and stops at its end, so no regex has to find the span
+_JSON_DECODER = json.JSONDecoder()
+
+def _iter_json_values(text: str):
+    """Yield each JSON array or object embedded in text, left to right."""
+    # str.find beats a [\[{] regex search, which has no literal prefix to skip with
+    bracket = text.find('[')
+    brace = text.find('{')
+    while bracket != -1 or brace != -1:
+        start = brace if bracket == -1 or (brace != -1 and brace < bracket) else bracket
+        try:
+            value, end = _JSON_DECODER.raw_decode(text, start)
+        except (json.JSONDecodeError, RecursionError):
+            # Not JSON here; values nested inside may still be complete
+            end = start + 1
+            value = None
+        if bracket != -1 and bracket < end:
+            bracket = text.find('[', end)
+        if brace != -1 and brace < end:
+            brace = text.find('{', end)
+        if value is not None:
+            yield value
+
+# Keys every issue produced by _validate_issue carries
+_VALIDATED_KEYS = frozenset(('severity', 'line', 'message', 'suggestion', 'tool'))
+# Severities the AI pass reports; warnings are left to the linters
+_REPORTED_SEVERITIES = frozenset(('security', 'error'))
+
+# Style and formatting findings dropped from AI output
+_SKIP_PHRASES = (
+    'unused import', 'unused variable', 'line too long', 'missing docstring',
+    'trailing whitespace', 'missing whitespace', 'unnecessary', 'redefinition',
+    'redefined', 'redundant', 'not in snake_case', 'not in lowercase',
+    'blank line', 'whitespace', 'missing final newline', 'too many', 'too few',
+    'line break', 'trailing newlines', 'trailing spaces', 'trailing comma',
+    'missing blank line', 'multiple imports', 'multiple statements',
+    'multiple spaces', 'unexpected spaces', 'unexpected indentation',
+    'bad quotes', 'bad indentation', 'bad continuation', 'bad whitespace',
+    'bad backslash', 'bad escape sequence', 'bad operator', 'bad except order',
+    'bad class attribute', 'bad staticmethod', 'bad super call',
+    'bad exception context', 'bad string format',
+)
+
+# Blocking errors - will prevent app from running
+_BLOCKING_ERROR_PHRASES = (
+    'syntax error', 'import error', 'module not found', 'indentation error',
+    'name error', 'type error', 'value error', 'key error', 'attribute error',
+    'not defined', 'missing required', 'invalid syntax', 'cannot import',
+    'no module named', 'function not found', 'class not found',
+    'missing parenthesis', 'unexpected indent', 'expected an indented block',
+    'blueprint not registered', 'app factory not found', 'create_app not found',
+)
+
+# Security issues - won't prevent running but are important
+_SECURITY_PHRASES = (
+    'vulnerability', 'injection', 'xss', 'csrf', 'clickjacking',
+    'directory traversal', 'path traversal', 'command injection',
+    'code injection', 'sql injection', 'eval', 'exec', 'pickle', 'yaml.load',
+    'subprocess', 'shell=true', 'os.system', 'os.popen', 'hardcoded secret',
+    'hardcoded password', 'hardcoded token', 'hardcoded key',
+    'hardcoded credential', 'exposed port', 'exposed host', '0.0.0.0',
+    'dotenv', 'environment variable', 'os.getenv', 'os.environ',
+)
+
+def _minimal_phrases(phrases: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Drop phrases containing another phrase; a substring scan over the rest matches the same text."""
+    unique = tuple(dict.fromkeys(phrases))
+    return tuple(p for p in unique if not any(q != p and q in p for q in unique))
+
+def _build_automaton(labelled_phrases):
+    """Build an Aho-Corasick automaton mapping each phrase to its label."""
+    automaton = ahocorasick.Automaton()
+    for phrase, label in labelled_phrases:
+        automaton.add_word(phrase, label)
+    automaton.make_automaton()
+    return automaton
+
+_SKIP_PHRASES_MINIMAL = _minimal_phrases(_SKIP_PHRASES)
+if ahocorasick is not None:
+    _SKIP_AUTOMATON = _build_automaton((p, p) for p in _SKIP_PHRASES_MINIMAL)
+    # Blocking phrases are added last so they win if a phrase is in both lists
+    _SEVERITY_AUTOMATON = _build_automaton(
+        [(p, 'security') for p in _SECURITY_PHRASES] + [(p, 'error') for p in _BLOCKING_ERROR_PHRASES]
+    )
+else:
+    _SKIP_AUTOMATON = _SEVERITY_AUTOMATON = None
+
+def _has_skip_phrase(message_lower: str) -> bool:
+    """Return True if a lowercased message mentions a skipped style issue."""
+    if _SKIP_AUTOMATON is not None:
+        return next(_SKIP_AUTOMATON.iter(message_lower), None) is not None
+    return any(phrase in message_lower for phrase in _SKIP_PHRASES_MINIMAL)
+
+# Files whose presence marks a project root
+_PROJECT_ROOT_INDICATORS = frozenset((
+    'package.json', 'requirements.txt', 'setup.py', 'Pipfile',
+    'pom.xml', 'build.gradle', 'Cargo.toml', 'go.mod',
+    '.git', '.gitignore', 'README.md'
+))
+
+@functools.lru_cache(maxsize=1024)
+def _has_root_indicator(directory: str, mtime_ns: int) -> bool:
+    """
+    Return True if directory holds a project indicator. Adding or removing an
+    entry changes the directory's mtime, so re-cloned checkouts are listed
+    again instead of answered from a stale entry.
+    """
+    try:
+        # One listing per level instead of a stat per indicator
+        names = os.listdir(directory)
+    except OSError:
+        return False
+    return not _PROJECT_ROOT_INDICATORS.isdisjoint(names)
+
+def _find_root_for_dir(directory: str) -> Optional[str]:
+    """
+    Return the nearest directory at or above directory that holds a project
+    indicator. Each level costs a stat; listings are cached per mtime.
+    """
+    while True:
+        parent = os.path.dirname(directory)
+        if parent == directory:  # At the filesystem root
+            return None
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        if mtime_ns is not None and _has_root_indicator(directory, mtime_ns):
+            return directory
+        directory = parent
+
 class ModelRunner:
     """Enhanced AI code analysis with lazy model loading and GPU-only execution."""
     
     def __init__(self, model_type: Optional[ModelType] = None):
-        self.model = None
+        self._model_ref = None
         self.model_config = None
         self.model_type = model_type or ModelType.DEEPSEEK_LITE
     
+    @property
+    def model(self):
+        """The loaded model, or None once the manager has evicted it."""
+        return self._model_ref() if self._model_ref is not None else None
+    
+    @model.setter
+    def model(self, model) -> None:
+        # Weak, so the manager's LRU alone decides how long a model stays in VRAM
+        self._model_ref = weakref.ref(model) if model is not None else None
+    
     
     def analyze(self, code: str, file_path: str) -> List[Dict[str, Any]]:
         """Public method to run the full analysis pipeline."""
         # 1. Run linting and pattern analysis first for quick feedback
         logger.info("Running linting analysis...")
         linting_issues = self._run_linting_analysis(code, file_path)
-        logger.info(f"Linting completed with {len(linting_issues)} issues found")
+        logger.info("Linting completed with %d issues found", len(linting_issues))
         
         # 2. Run AI analysis for deeper insights
         logger.info("Running AI analysis...")
@@ -41,50 +453,58 @@ class ModelRunner:
             ai_issues = []
         else:
             ai_issues = self._run_ai_analysis(code, file_path)
-        logger.info(f"AI analysis completed with {len(ai_issues)} additional issues found")
+        logger.info("AI analysis completed with %d additional issues found", len(ai_issues))
         
         # 3. Combine and process results
         all_issues = linting_issues + ai_issues
         unique_issues = self._deduplicate_issues(all_issues)
         
-        logger.info(f"Analysis complete. Total unique issues found: {len(unique_issues)}")
+        logger.info("Analysis complete. Total unique issues found: %d", len(unique_issues))
         return unique_issues
 
     def _run_linting_analysis(self, code: str, file_path: str) -> List[Dict[str, Any]]:
         """Run basic linting and pattern matching for common issues."""
         issues = []
-        # Simple pattern matching for common anti-patterns
-        patterns = {
-            "Use of eval": r"\beval\s*\(",
-            "Use of pickle": r"import\s+pickle|from\s+pickle\s+import",
-            "Hardcoded secret (heuristic)": r"(secret|password|key)"
-        }
+        ascii_only = code.isascii()
+        text = code.lower() if ascii_only else code
+        line_ends = None
         
-        for message, pattern in patterns.items():
-            for i, line in enumerate(code.splitlines()):
-                if re.search(pattern, line, re.IGNORECASE):
-                    issues.append({
-                        'line': i + 1,
-                        'severity': 'security',
-                        'message': message,
-                        'suggestion': 'Review usage of potentially insecure function or hardcoded secret.'
-                    })
-        logger.info(f"Pattern analysis found {len(issues)} issues")
+        # Whole-file scans; line numbers come from offsets, one issue per pattern and line
+        for message, pattern, pattern_nocase, word_start in _LINT_RULES:
+            last_line = 0
+            for match in (pattern if ascii_only else pattern_nocase).finditer(text):
+                start = match.start()
+                if word_start and start and (text[start - 1].isalnum() or text[start - 1] == '_'):
+                    continue
+                if line_ends is None:
+                    line_ends = list(accumulate(map(len, code.splitlines(True))))
+                line = bisect_right(line_ends, start) + 1
+                # Patterns are line-local; a match running across a line break does not count
+                if line == last_line or bisect_right(line_ends, match.end() - 1) + 1 != line:
+                    continue
+                last_line = line
+                issues.append({
+                    'line': line,
+                    'severity': 'security',
+                    'message': message,
+                    'suggestion': 'Review usage of potentially insecure function or hardcoded secret.'
+                })
+        logger.info("Pattern analysis found %d issues", len(issues))
         return issues
 
     def _ensure_model_loaded(self) -> bool:
         """Ensure the AI model is loaded, loading it if necessary."""
-        if self.model and self.model_config:
+        if self.model is not None and self.model_config is not None:
             return True
         
-        logger.info(f"Loading model on demand: {self.model_type.value}")
+        logger.info("Loading model on demand: %s", self.model_type.value)
         
         # Get model from manager (will load if not cached)
-        self.model = model_manager.get_loaded_model(self.model_type.value)
-        self.model_config = model_manager.get_model_config(self.model_type.value)
+        self.model = model_manager.get_loaded_model(self.model_type)
+        self.model_config = model_manager.get_model_config(self.model_type)
         
         if not self.model or not self.model_config:
-            logger.error(f"Failed to load model: {self.model_type.value}")
+            logger.error("Failed to load model: %s", self.model_type.value)
             return False
         
         return True
@@ -106,60 +526,160 @@ class ModelRunner:
         Returns:
             List of critical issue dictionaries
         """
-        # Load model on demand
-        if not self._ensure_model_loaded():
-            logger.warning("AI model not available, skipping AI analysis")
-            return []
-
+        # analyze() has already loaded the model
         try:
             prompt = self._build_ai_prompt(code, file_path, related_files)
 
+            # An identical prompt was already answered; skip the model entirely
+            cache_key = _prompt_key(prompt, self.model_type)
+            cached = _get_cached_ai_issues(cache_key)
+            if cached is not None:
+                logger.info("AI analysis served from cache")
+                return cached
+
             # Generate response with model-specific settings
-            response = self.model(
-                prompt,
-                max_tokens=self.model_config.max_tokens if self.model_config else 2000,
-                temperature=self.model_config.temperature if self.model_config else 0.2,
-                stop=["</s>", "[/INST]", "```"],
-                repeat_penalty=1.1,
-                top_k=40,
-                top_p=0.95
-            )
+            response_text, tokens_used = self._generate_json_array(prompt, code.count('\n') + 1)
 
             # Log token usage
-            tokens_used = len(response['choices'][0]['text'].split())
-            logger.info(f"AI analysis used {tokens_used} tokens")
+            logger.info("AI analysis used %s tokens", tokens_used)
 
-            response_text = response['choices'][0]['text'].strip()
-            self._save_response(response_text, 'ai_response.txt')
+            response_text = response_text.strip()
+            # Raw output is only for debugging; skip the synchronous dump otherwise
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("AI raw output: %r", response_text)
+                self._save_response(response_text, 'ai_response.txt')
 
             # Clean and parse the response
             issues = self._clean_and_parse_json(response_text)
 
-            # Add tool source and validate issues
-            validated_issues = []
-            for issue in issues:
-                validated = self._validate_issue(issue, file_path)
-                if validated:
-                    # Only include security and critical errors
-                    if validated.get('severity') in ['security', 'error']:
-                        validated['tool'] = 'shard-ai'
-                        validated_issues.append(validated)
+            # Parsed issues are already normalized by _validate_issue; the key check
+            # only drops placeholders, then keep security and critical errors
+            validated_issues = [
+                issue for issue in issues
+                if type(issue) is dict and issue.keys() >= _VALIDATED_KEYS
+                and issue['severity'] in _REPORTED_SEVERITIES
+            ]
+            if file_path:
+                for issue in validated_issues:
+                    issue['file'] = file_path
             
+            _store_ai_issues(cache_key, validated_issues)
             return validated_issues
                 
         except Exception as e:
-            logger.error(f"Error during AI model execution: {str(e)}", exc_info=True)
+            logger.error("Error during AI model execution: %s", e, exc_info=True)
             return [{
                 'line': 1,
-                'message': 'AI analysis failed. Check the logs for details.',
+                'message': AI_FAILURE_MESSAGE,
                 'severity': 'error',
                 'tool': 'shard-ai',
                 'suggestion': 'The AI model encountered an error. Please check the logs for more information.'
             }]
     
+    def _generate_json_array(self, prompt: str, line_count: int = 0) -> Tuple[str, int]:
+        """
+        Stream a grammar-constrained completion and stop as soon as the
+        top-level JSON array closes.
+
+        Args:
+            prompt: The full prompt
+            line_count: Lines of code under review, used to size the output budget
+
+        Returns:
+            The generated text and the number of streamed chunks (tokens)
+        """
+        buf = []
+        depth = 0
+        started = False
+        in_string = False
+        escaped = False
+        tokens_used = 0
+
+        max_tokens = self.model_config.max_tokens if self.model_config else 2000
+        if line_count:
+            expected_issues = max(1, line_count // 20)
+            max_tokens = min(max_tokens, _BASE_OUTPUT_TOKENS + _TOKENS_PER_ISSUE * expected_issues)
+
+        # Hold a strong reference for the whole generation
+        model = self.model
+        if model is None:
+            if not self._ensure_model_loaded():
+                raise RuntimeError(f"Model {self.model_type.value} is not available")
+            model = self.model
+
+        with _MODEL_LOCK:
+            self._restore_prelude(model, prompt)
+            stream = model(
+                prompt,
+                max_tokens=max_tokens,
+                temperature=self.model_config.temperature if self.model_config else 0.2,
+                stop=["</s>", "[/INST]", "```"],
+                repeat_penalty=1.1,
+                top_k=40,
+                top_p=0.95,
+                grammar=_get_issue_grammar(),
+                stream=True
+            )
+            try:
+                for chunk in stream:
+                    text = chunk['choices'][0]['text']
+                    buf.append(text)
+                    tokens_used += 1
+
+                    # Track array depth, ignoring brackets inside JSON strings
+                    for ch in text:
+                        if in_string:
+                            if escaped:
+                                escaped = False
+                            elif ch == '\\':
+                                escaped = True
+                            elif ch == '"':
+                                in_string = False
+                        elif ch == '"':
+                            in_string = True
+                        elif ch == '[':
+                            depth += 1
+                            started = True
+                        elif ch == ']':
+                            depth -= 1
+                    if started and depth <= 0:
+                        break
+            finally:
+                stream.close()
+
+        return ''.join(buf), tokens_used
+
+    def _restore_prelude(self, model, prompt: str) -> None:
+        """
+        Load the evaluated state of the static prompt head, priming it on first
+        use. llama.cpp matches the loaded tokens against the new prompt, so only
+        the rest is evaluated. Must be called with _MODEL_LOCK held.
+        """
+        prelude = next((p for p in _PROMPT_PRELUDES if prompt.startswith(p)), None)
+        if prelude is None:
+            return
+        try:
+            states = _prelude_states.setdefault(model, {})
+            saved = states.get(prelude)
+            if saved is None:
+                tokens = model.tokenize(prelude.encode('utf-8'))
+                model.reset()
+                model.eval(tokens)
+                states[prelude] = (tokens, model.save_state())
+                return
+            tokens, state = saved
+            # The previous prompt of the same language left the prelude in the
+            # context; llama.cpp's prefix match reuses it without a state copy
+            n = len(tokens)
+            if model.n_tokens >= n and model.input_ids[:n].tolist() == tokens:
+                return
+            model.load_state(state)
+        except Exception as e:
+            # Only a missed optimization; the completion evaluates the full prompt
+            logger.debug("Prompt prelude state unavailable: %s", e)
+
     def _build_ai_prompt(self, code: str, file_path: Optional[str] = None, related_files: Optional[Dict[str, str]] = None) -> str:
         is_js = file_path and file_path.endswith(('.js', '.jsx', '.ts', '.tsx'))
-        file_ext = os.path.splitext(file_path or '')[-1].lower()
         
         # Get enhanced project context
         enhanced_context = ''
@@ -173,84 +693,34 @@ class ModelRunner:
                     if enhanced_context:
                         enhanced_context = f'\n\nProject Context:\n{enhanced_context}\n'
             except Exception as e:
-                logger.warning(f"Failed to get enhanced context: {e}")
+                logger.warning("Failed to get enhanced context: %s", e)
         
         # Add basic related files context as fallback
         related_files_context = ''
         if related_files and not enhanced_context:
-            related_files_context = '\n\nRelated files (for reference only):\n'
-            for rel_path, content in list(related_files.items())[:3]:  # Limit to 3 files
-                related_files_context += f'\n--- {rel_path} ---\n{content[:400]}...\n'
+            related_files_context = '\n\nRelated files (for reference only):\n' + ''.join(
+                f'\n--- {rel_path} ---\n{content[:400]}...\n'
+                for rel_path, content in islice(related_files.items(), 3)  # Limit to 3 files
+            )
+        # Each template is a single f-string, so the prompt is assembled in one allocation
         if is_js:
-            prompt = f"""[INST] <<SYS>>
-You are an advanced JavaScript/TypeScript code analyzer. Your task is to thoroughly analyze code and return a JSON array of issues with detailed information.
-
-CRITICAL RULES:
-1. Output MUST be a valid JSON array only - no other text or explanations.
-2. For each issue, provide:
-   - `severity`: "error" (prevents execution), "warning" (potential issue), or "security" (vulnerability)
-   - `line`: Line number where issue occurs (1-based)
-   - `message`: Concise description of the issue
-   - `suggestion`: Specific code fix or recommendation
-   - `category`: One of ["syntax", "type", "security", "performance", "best-practice"]
-3. Always validate JSON syntax before returning.
-
-ANALYSIS PRIORITY:
-1. CRITICAL: Syntax errors, missing imports, undefined variables
-2. SECURITY: XSS, injection, auth issues, sensitive data exposure
-3. ERRORS: Runtime errors, type mismatches, invalid operations
-4. WARNINGS: Code smells, anti-patterns, deprecated APIs
-
-IGNORE:
-- Code style issues (formatting, naming conventions)
-- Comments and documentation
-- Test files (*.test.js, *.spec.js)
-- Third-party library code in node_modules
-
-<</SYS>>
+            prompt = f"""{_JS_PROMPT_PRELUDE}Additional context:
+{enhanced_context}{related_files_context}
 
 Analyze this JavaScript/TypeScript code from {file_path or 'unknown file'}:
 ```
 {code}
 ```
 
-Additional context:
-{enhanced_context}{related_files_context}
-
 Return ONLY a JSON array of issues, no other text.[/INST]"""
         else:
-            prompt = f"""[INST]
-Analyze the following Python code for security vulnerabilities and critical errors.
-
-**File Path:** {file_path or 'unknown file'}
-
+            prompt = f"""{_PY_PROMPT_PRELUDE}**File Path:** {file_path or 'unknown file'}
+{enhanced_context}{related_files_context}
 **Code to Analyze:**
 ```python
 {code}
 ```
 
-**Instructions:**
-1.  Identify critical errors and security vulnerabilities.
-2.  Your response MUST be a valid JSON array.
-3.  Each object in the array must contain these keys:
-    - `line` (integer): The line number of the issue.
-    - `severity` (string): "error", "warning", or "security".
-    - `message` (string): A concise description of the issue.
-    - `suggestion` (string): A specific recommendation for a fix.
-4.  Do NOT include explanations, comments, or any text outside the JSON array.
-
-**Example of a valid response:**
-[
-  {{
-    "line": 10,
-    "severity": "security",
-    "message": "Use of 'eval' is a security risk.",
-    "suggestion": "Replace 'eval' with a safer alternative like 'ast.literal_eval' or refactor the logic to avoid dynamic execution."
-  }}
-]
-
-{enhanced_context}{related_files_context}
-
 **JSON Output Only:**
 [/INST]"""
 
@@ -260,29 +730,17 @@ Analyze the following Python code for security vulnerabilities and critical erro
         if not text or not isinstance(text, str):
             return []
         
-        original_text = text
-        json_patterns = [r'\[\s*\{.*\}\s*\]', r'\{\s*"issues"\s*:\s*\[.*\]\s*\}', r'\{.*\}', r'\[.*\]']
-        
         try:
-            data = json.loads(text)
+            data = _json_loads(text)
             return self._extract_issues_from_data(data)
         except json.JSONDecodeError:
             pass
         
-        try:
-            for pattern in json_patterns:
-                match = re.search(pattern, text, re.DOTALL)
-                if match:
-                    json_str = match.group(0).strip()
-                    try:
-                        data = json.loads(json_str)
-                        issues = self._extract_issues_from_data(data)
-                        if issues:
-                            return issues
-                    except json.JSONDecodeError:
-                        continue
-        except Exception:
-            pass
+        # Otherwise decode each JSON value in the text until one yields issues
+        for data in _iter_json_values(text):
+            issues = self._extract_issues_from_data(data)
+            if issues:
+                return issues
         
         return [{
             'line': 1,
@@ -304,76 +762,25 @@ Analyze the following Python code for security vulnerabilities and critical erro
                 issue = self._validate_issue(data)
                 return [issue] if issue else []
         except Exception as e:
-            logger.error(f"Error extracting issues from data: {e}", exc_info=True)
+            logger.error("Error extracting issues from data: %s", e, exc_info=True)
         return []
     
     def _classify_severity(self, message: str) -> str:
         """Classify the severity of an issue based on its message."""
         message_lower = message.lower()
         
-        # Blocking errors - will prevent app from running
-        blocking_errors = [
-            'syntax error',
-            'import error',
-            'module not found',
-            'indentation error',
-            'name error',
-            'type error',
-            'value error',
-            'key error',
-            'attribute error',
-            'not defined',
-            'missing required',
-            'invalid syntax',
-            'cannot import',
-            'no module named',
-            'function not found',
-            'class not found',
-            'missing parenthesis',
-            'unexpected indent',
-            'expected an indented block',
-            'blueprint not registered',
-            'app factory not found',
-            'create_app not found'
-        ]
-        
-        # Security issues - won't prevent running but are important
-        security_issues = [
-            'vulnerability',
-            'injection',
-            'xss',
-            'csrf',
-            'clickjacking',
-            'directory traversal',
-            'path traversal',
-            'command injection',
-            'code injection',
-            'sql injection',
-            'eval',
-            'exec',
-            'pickle',
-            'yaml.load',
-            'subprocess',
-            'shell=true',
-            'os.system',
-            'os.popen',
-            'hardcoded secret',
-            'hardcoded password',
-            'hardcoded token',
-            'hardcoded key',
-            'hardcoded credential',
-            'exposed port',
-            'exposed host',
-            '0.0.0.0',
-            'dotenv',
-            'environment variable',
-            'os.getenv',
-            'os.environ'
-        ]
+        if _SEVERITY_AUTOMATON is not None:
+            # One pass finds every phrase; blocking errors outrank security issues
+            severity = 'warning'
+            for _, label in _SEVERITY_AUTOMATON.iter(message_lower):
+                if label == 'error':
+                    return 'error'
+                severity = 'security'
+            return severity
         
-        if any(error in message_lower for error in blocking_errors):
+        if any(error in message_lower for error in _BLOCKING_ERROR_PHRASES):
             return 'error'
-        if any(issue in message_lower for issue in security_issues):
+        if any(issue in message_lower for issue in _SECURITY_PHRASES):
             return 'security'
         return 'warning'
     
@@ -385,85 +792,7 @@ Analyze the following Python code for security vulnerabilities and critical erro
         message = str(issue.get('message', ''))
         
         # Skip style and formatting issues
-        skip_phrases = [
-            'unused import',
-            'unused variable',
-            'line too long',
-            'missing docstring',
-            'trailing whitespace',
-            'missing whitespace',
-            'unnecessary',
-            'redefinition',
-            'redefined',
-            'redundant',
-            'not in snake_case',
-            'not in lowercase',
-            'blank line',
-            'whitespace',
-            'missing final newline',
-            'too many',
-            'too few',
-            'line break',
-            'trailing newlines',
-            'trailing spaces',
-            'trailing comma',
-            'missing blank line',
-            'multiple imports',
-            'multiple statements',
-            'multiple spaces',
-            'unexpected spaces',
-            'unexpected indentation',
-            'bad quotes',
-            'bad indentation',
-            'bad continuation',
-            'bad quotes',
-            'bad whitespace',
-            'bad backslash',
-            'bad escape sequence',
-            'bad operator',
-            'bad except order',
-            'bad class attribute',
-            'bad staticmethod',
-            'bad super call',
-            'bad exception context',
-            'bad string format type',
-            'bad string format',
-            'bad string format character',
-            'bad string format field',
-            'bad string format key',
-            'bad string format value',
-            'bad string format converter',
-            'bad string format specifier',
-            'bad string format field name',
-            'bad string format field attribute',
-            'bad string format field element',
-            'bad string format field key',
-            'bad string format field value',
-            'bad string format field width',
-            'bad string format field precision',
-            'bad string format field type',
-            'bad string format field conversion',
-            'bad string format field format_spec',
-            'bad string format field replacement',
-            'bad string format field mapping',
-            'bad string format field mapping key',
-            'bad string format field mapping value',
-            'bad string format field mapping pair',
-            'bad string format field mapping key value',
-            'bad string format field mapping key value pair',
-            'bad string format field mapping key value pairs',
-            'bad string format field mapping key value pairs list',
-            'bad string format field mapping key value pairs list item',
-            'bad string format field mapping key value pairs list items',
-            'bad string format field mapping key value pairs list items list',
-            'bad string format field mapping key value pairs list items list item',
-            'bad string format field mapping key value pairs list items list items',
-            'bad string format field mapping key value pairs list items list items list',
-            'bad string format field mapping key value pairs list items list items list item',
-            'bad string format field mapping key value pairs list items list items list items'
-        ]
-        
-        if any(phrase in message.lower() for phrase in skip_phrases):
+        if _has_skip_phrase(message.lower()):
             return None
             
         # Determine severity
@@ -484,52 +813,20 @@ Analyze the following Python code for security vulnerabilities and critical erro
 
     def _find_project_root(self, file_path: str) -> Optional[str]:
         """Find the project root directory."""
-        current_dir = os.path.dirname(os.path.abspath(file_path))
-        
-        # Look for common project indicators
-        indicators = [
-            'package.json', 'requirements.txt', 'setup.py', 'Pipfile',
-            'pom.xml', 'build.gradle', 'Cargo.toml', 'go.mod',
-            '.git', '.gitignore', 'README.md'
-        ]
-        
-        while current_dir != os.path.dirname(current_dir):  # Not at root
-            for indicator in indicators:
-                if os.path.exists(os.path.join(current_dir, indicator)):
-                    return current_dir
-            current_dir = os.path.dirname(current_dir)
-        
-        return None
+        return _find_root_for_dir(os.path.dirname(os.path.abspath(file_path)))
     
     def _is_working_code(self, code: str) -> bool:
         return False
 
     def _save_response(self, response_text: str, file_name: str):
-        """Save the AI's raw response to a text file for debugging."""
-        try:
-            # Ensure the directory exists
-            log_dir = os.path.join(os.path.dirname(__file__), '..', 'logs')
-            os.makedirs(log_dir, exist_ok=True)
-            
-            file_path = os.path.join(log_dir, file_name)
-            
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(response_text)
-            logger.info(f"Saved AI response to {file_path}")
-        except Exception as e:
-            logger.error(f"Failed to save AI response: {e}")
+        """Queue the AI's raw response to be saved to a text file for debugging."""
+        _queue_response(file_name, response_text)
 
     def _deduplicate_issues(self, issues: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Deduplicate issues based on file, line, and message."""
-        unique_issues = []
-        seen = set()
-        
+        # Dicts keep insertion order, so the first issue for each key wins in place
+        unique_issues = {}
         for issue in issues:
-            # Create a unique key for each issue
-            issue_key = (issue.get('file'), issue.get('line'), issue.get('message'))
-            if issue_key not in seen:
-                unique_issues.append(issue)
-                seen.add(issue_key)
-                
-        return unique_issues
+            unique_issues.setdefault((issue.get('file'), issue.get('line'), issue.get('message')), issue)
+        return list(unique_issues.values())
 
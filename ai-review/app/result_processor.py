@@ -1,20 +1,61 @@
-import json
+import functools
 import logging
-from typing import List, Dict, Any
-from collections import defaultdict
+import sys
+from typing import Iterable, List, Dict, Any
+from collections import Counter
+from itertools import chain
+from operator import itemgetter
 
 logger = logging.getLogger(__name__)
 
+SEVERITY_PRIORITY = {
+    'security': 4,
+    'error': 3,
+    'warning': 2,
+    'style': 1,
+    'info': 1
+}
+
+# Severity names used by other tools, mapped onto the standard levels
+SEVERITY_ALIASES = {
+    'high': 'error',
+    'medium': 'warning',
+    'low': 'info',
+    'critical': 'security',
+    'major': 'error',
+    'minor': 'warning',
+    'trivial': 'style'
+}
+
+# Aliases plus the standard levels mapped to themselves, so severities that are
+# already lowercase resolve with one lookup and no .lower() copy
+_SEVERITY_LUT = {
+    **{level: level for level in SEVERITY_PRIORITY},
+    **SEVERITY_ALIASES
+}
+
+@functools.lru_cache(maxsize=32)
+def _fold_severity(severity: str) -> str:
+    """Lowercase a severity the table missed and map it, memoized per spelling."""
+    # Interning hands back the canonical 'error', 'warning', ... objects, so
+    # the priority and count lookups downstream match on identity
+    severity = sys.intern(severity.lower())
+    return _SEVERITY_LUT.get(severity, severity)
+
+# Verdict thresholds: deny above these security and warning counts, and only
+# ask for manual review of AI security findings below the linter error limit
+_MAX_SECURITY_ISSUES = 10
+_MAX_WARNING_ISSUES = 20
+_MAX_LINTER_ERRORS_FOR_REVIEW = 20
+
+def _priority_sort_key(issue, _priority=SEVERITY_PRIORITY.get):
+    """Order issues by severity, then file and line."""
+    return (-_priority(issue['severity'], 0), issue['file'], issue['line'])
+
 class ResultProcessor:
     """Post-processing layer to merge, deduplicate and rank code analysis results"""
     
-    SEVERITY_PRIORITY = {
-        'security': 4,
-        'error': 3,
-        'warning': 2,
-        'style': 1,
-        'info': 1
-    }
+    SEVERITY_PRIORITY = SEVERITY_PRIORITY
     
     def __init__(self):
         pass
@@ -22,14 +63,12 @@ class ResultProcessor:
     def merge_results(self, linter_issues: List[Dict], deepseek_issues: List[Dict]) -> List[Dict]:
         """Merge linter and DeepSeek results, deduplicate and rank by severity"""
         
-        # Normalize linter issues to match DeepSeek format
-        normalized_linter = self._normalize_linter_issues(linter_issues)
-        
-        # Normalize DeepSeek issues
-        normalized_deepseek = self._normalize_deepseek_issues(deepseek_issues)
-        
-        # Combine all issues
-        all_issues = normalized_linter + normalized_deepseek
+        # Normalize both sources lazily and deduplicate as they stream in,
+        # without building the intermediate normalized and combined lists
+        all_issues = chain(
+            map(self._normalize_linter_issue, linter_issues),
+            map(self._normalize_deepseek_issue, deepseek_issues)
+        )
         
         # Deduplicate similar issues
         deduplicated = self._deduplicate_issues(all_issues)
@@ -41,111 +80,98 @@ class ResultProcessor:
     
     def _normalize_linter_issues(self, issues: List[Dict]) -> List[Dict]:
         """Normalize linter issues to standard format"""
-        normalized = []
-        
-        for issue in issues:
-            normalized_issue = {
-                'tool': issue.get('tool', 'unknown'),
-                'severity': self._map_severity(issue.get('severity', 'info')),
-                'file': issue.get('file', ''),
-                'line': issue.get('line', 0),
-                'column': issue.get('column', 0),
-                'code': issue.get('code', ''),
-                'message': issue.get('message', ''),
-                'suggestion': issue.get('suggestion', '')
-            }
-            normalized.append(normalized_issue)
-            
-        return normalized
+        return [self._normalize_linter_issue(issue) for issue in issues]
+    
+    def _normalize_linter_issue(self, issue: Dict) -> Dict:
+        return {
+            'tool': issue.get('tool', 'unknown'),
+            'severity': self._map_severity(issue.get('severity', 'info')),
+            'file': issue.get('file', ''),
+            'line': issue.get('line', 0),
+            'column': issue.get('column', 0),
+            'code': issue.get('code', ''),
+            'message': issue.get('message', ''),
+            'suggestion': issue.get('suggestion', '')
+        }
     
     def _normalize_deepseek_issues(self, issues: List[Dict]) -> List[Dict]:
         """Normalize DeepSeek issues to standard format"""
-        normalized = []
-        
-        for issue in issues:
-            normalized_issue = {
-                'tool': 'shard-ai',
-                'severity': self._map_severity(issue.get('severity', 'info')),
-                'file': '',  # DeepSeek doesn't specify file in current implementation
-                'line': issue.get('line', 0),
-                'column': 0,
-                'code': 'AI_ANALYSIS',
-                'message': issue.get('message', ''),
-                'suggestion': issue.get('suggestion', '')
-            }
-            normalized.append(normalized_issue)
-            
-        return normalized
+        return [self._normalize_deepseek_issue(issue) for issue in issues]
+    
+    def _normalize_deepseek_issue(self, issue: Dict) -> Dict:
+        return {
+            'tool': 'shard-ai',
+            'severity': self._map_severity(issue.get('severity', 'info')),
+            'file': '',  # DeepSeek doesn't specify file in current implementation
+            'line': issue.get('line', 0),
+            'column': 0,
+            'code': 'AI_ANALYSIS',
+            'message': issue.get('message', ''),
+            'suggestion': issue.get('suggestion', '')
+        }
     
     def _map_severity(self, severity: str) -> str:
         """Map various severity formats to standard format"""
-        severity_map = {
-            'high': 'error',
-            'medium': 'warning', 
-            'low': 'info',
-            'critical': 'security',
-            'major': 'error',
-            'minor': 'warning',
-            'trivial': 'style'
-        }
-        
-        return severity_map.get(severity.lower(), severity.lower())
+        mapped = _SEVERITY_LUT.get(severity)
+        if mapped is not None:
+            return mapped
+        return _fold_severity(severity)
     
-    def _deduplicate_issues(self, issues: List[Dict]) -> List[Dict]:
+    def _deduplicate_issues(self, issues: Iterable[Dict]) -> List[Dict]:
         """Remove duplicate or very similar issues"""
-        # Group issues by file and line
-        grouped = defaultdict(list)
+        # One pass keeps the best issue per file, line and message prefix. The rank
+        # orders lines by first appearance, then severity, then linters before
+        # shard-ai, then input order, which is the order issues come out in.
+        line_order = {}
+        best = {}
+        priority = SEVERITY_PRIORITY.get
         
-        for issue in issues:
-            key = f"{issue['file']}:{issue['line']}"
-            grouped[key].append(issue)
-        
-        deduplicated = []
+        for index, issue in enumerate(issues):
+            line_key = (issue['file'], issue['line'])
+            group = line_order.setdefault(line_key, len(line_order))
+            message = issue['message']
+            head = message[:50]
+            # Lowercase just the head unless case folding could change its length
+            prefix = head.lower() if head.isascii() else message.lower()[:50]
+            rank = (group, -priority(issue['severity'], 0), issue['tool'] == 'shard-ai', index)
+            key = (line_key, prefix)
+            current = best.get(key)
+            if current is None or rank < current[0]:
+                best[key] = (rank, issue)
         
-        for key, group in grouped.items():
-            if len(group) == 1:
-                deduplicated.append(group[0])
-            else:
-                # If multiple issues on same line, prioritize by severity and tool
-                group_sorted = sorted(group, key=lambda x: (
-                    -self.SEVERITY_PRIORITY.get(x['severity'], 0),
-                    x['tool'] == 'shard-ai'  # Prefer DeepSeek for AI insights
-                ))
-                
-                # Check for similar messages to avoid true duplicates
-                unique_messages = set()
-                for issue in group_sorted:
-                    message_key = issue['message'].lower()[:50]  # First 50 chars
-                    if message_key not in unique_messages:
-                        unique_messages.add(message_key)
-                        deduplicated.append(issue)
-        
-        return deduplicated
+        return [issue for _, issue in sorted(best.values(), key=itemgetter(0))]
     
     def _sort_by_priority(self, issues: List[Dict]) -> List[Dict]:
         """Sort issues by severity priority, then by line number"""
-        return sorted(issues, key=lambda x: (
-            -self.SEVERITY_PRIORITY.get(x['severity'], 0),
-            x['file'],
-            x['line']
-        ))
+        # sorted() computes each key once, so the lookups are n, not n log n
+        return sorted(issues, key=_priority_sort_key)
     
     def generate_verdict(self, issues: List[Dict], service: str) -> Dict[str, Any]:
         """Generate deployment verdict based on processed issues"""
 
-        severity_counts = defaultdict(int)
+        # Counter tallies in C; the flags and counts below only look at the
+        # error and security rows, in the same pass
+        severity_counts = Counter(map(itemgetter('severity'), issues))
         linter_error_count = 0
         ai_security_issue_count = 0
         has_syntax_error = False
+        critical_errors = 0
 
         for issue in issues:
-            severity_counts[issue['severity']] += 1
-            if issue.get('tool') != 'shard-ai' and issue.get('severity') == 'error':
-                linter_error_count += 1
-            if issue.get('tool') == 'shard-ai' and issue.get('severity') == 'security':
+            severity = issue['severity']
+            if severity == 'error':
+                if issue.get('tool') != 'shard-ai':
+                    linter_error_count += 1
+                if issue.get('code') == 'syntax-error':
+                    has_syntax_error = True
+                # Exclude Flask structure issues from blocking deployment
+                message = issue.get('message', '')
+                if not ('Flask app is not being run directly' in message or
+                        'run.py' in message or
+                        'create_app()' in message):
+                    critical_errors += 1
+            elif severity == 'security' and issue.get('tool') == 'shard-ai':
                 ai_security_issue_count += 1
-            if issue.get('code') == 'syntax-error' and issue.get('severity') == 'error':
-                has_syntax_error = True
 
         total_issues = len(issues)
 
@@ -159,29 +185,23 @@ class ResultProcessor:
                 'issues': issues
             }
 
-        security_issues = severity_counts['security']
-        error_issues = severity_counts['error']
-        warning_issues = severity_counts['warning']
+        # setdefault keeps the zero entries in the reported breakdown
+        security_issues = severity_counts.setdefault('security', 0)
+        error_issues = severity_counts.setdefault('error', 0)
+        warning_issues = severity_counts.setdefault('warning', 0)
 
-        # Decision logic - exclude Flask structure issues from blocking deployment
-        critical_errors = 0
-        for issue in issues:
-            if (issue.get('severity') == 'error' and 
-                not ('Flask app is not being run directly' in issue.get('message', '') or
-                     'run.py' in issue.get('message', '') or
-                     'create_app()' in issue.get('message', ''))):
-                critical_errors += 1
-        
-        if has_syntax_error or critical_errors >= 1:
+        # Decision logic
+        # Syntax errors returned above, so only the counts decide from here
+        if critical_errors >= 1:
             verdict = 'deny'
             reason = f"Deployment denied due to {critical_errors} critical error(s)."
-        elif security_issues > 10:
+        elif security_issues > _MAX_SECURITY_ISSUES:
             verdict = 'deny'
             reason = f"Deployment denied due to excessive security vulnerabilities ({security_issues} found)."
-        elif warning_issues > 20:
+        elif warning_issues > _MAX_WARNING_ISSUES:
             verdict = 'deny'
             reason = f"Deployment denied due to an excessive number of warnings ({warning_issues} found)."
-        elif service == 'ai-review' and ai_security_issue_count > 0 and linter_error_count < 20:
+        elif service == 'ai-review' and ai_security_issue_count > 0 and linter_error_count < _MAX_LINTER_ERRORS_FOR_REVIEW:
             verdict = 'manual_review'
             reason = f"{ai_security_issue_count} security issue(s) require manual review before deployment."
         else:
@@ -1,3 +1,206 @@
-from django.test import TestCase
+import os
+import subprocess
+import sys
+import tempfile
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from . import linter_service
+from .model_runner import ModelRunner
+from .result_processor import ResultProcessor
+from .utils import repo_fingerprint
+
+# Service root (ai-review/), so subprocesses can import the app package
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class PromptKeyTests(SimpleTestCase):
+    """The AI cache key must not depend on per-process state."""
+
+    KEY_SCRIPT = (
+        "import sys\n"
+        "from app.model_runner import ModelRunner, _prompt_key\n"
+        "runner = ModelRunner()\n"
+        "prompt = runner._build_ai_prompt(open(sys.argv[1]).read(), sys.argv[1])\n"
+        "assert 'Tech Stack:' in prompt\n"
+        "print(_prompt_key(prompt, runner.model_type))\n"
+    )
+
+    def test_prompt_key_is_stable_across_hash_seeds(self):
+        with tempfile.TemporaryDirectory() as project:
+            with open(os.path.join(project, 'package.json'), 'w') as f:
+                f.write('{"dependencies": {"react": "1", "express": "1", "vite": "1"}}')
+            for name in ('requirements.txt', 'Dockerfile', 'docker-compose.yml', 'yarn.lock'):
+                open(os.path.join(project, name), 'w').close()
+            target = os.path.join(project, 'main.py')
+            with open(target, 'w') as f:
+                f.write('import os\nprint(os.getcwd())\n')
+
+            keys = set()
+            for seed in ('1', '2', '3'):
+                env = dict(os.environ, PYTHONHASHSEED=seed, PYTHONPATH=SERVICE_DIR)
+                # Run inside the project so the service log lands there
+                result = subprocess.run(
+                    [sys.executable, '-c', self.KEY_SCRIPT, target],
+                    cwd=project, env=env, capture_output=True, text=True, check=True
+                )
+                keys.add(result.stdout.strip().splitlines()[-1])
+            self.assertEqual(len(keys), 1)
+
+
+class LinterCacheTests(SimpleTestCase):
+    """Only complete, successful linter runs may be replayed from the cache."""
+
+    def setUp(self):
+        linter_service._lint_cache.clear()
+        self.addCleanup(linter_service._lint_cache.clear)
+        repo = tempfile.TemporaryDirectory()
+        self.addCleanup(repo.cleanup)
+        self.repo = repo.name
+        with open(os.path.join(repo.name, 'a.py'), 'w') as f:
+            f.write('x = 1\n')
+        self.service = linter_service.LinterService(repo.name)
+        self.calls = 0
+
+    def runner(self, issues, ok=True):
+        def run(files):
+            self.calls += 1
+            return [dict(issue) for issue in issues], ok
+        return run
+
+    def test_per_file_result_with_unmatched_issue_is_not_cached(self):
+        run = self.runner([{'file': 'elsewhere.py', 'line': 1}])
+        for _ in range(2):
+            issues, ok = self.service._run_per_file_cached('flake8', run, ['a.py'], '.flake8')
+            self.assertTrue(ok)
+            self.assertEqual([issue['file'] for issue in issues], ['elsewhere.py'])
+        self.assertEqual(self.calls, 2)
+
+    def test_per_file_result_of_failed_run_is_not_cached(self):
+        run = self.runner([], ok=False)
+        for _ in range(2):
+            issues, ok = self.service._run_per_file_cached('flake8', run, ['a.py'], '.flake8')
+            self.assertFalse(ok)
+            self.assertEqual(issues, [])
+        self.assertEqual(self.calls, 2)
+
+    def test_batch_result_of_failed_run_is_not_cached(self):
+        run = self.runner([], ok=False)
+        for _ in range(2):
+            self.assertEqual(self.service._run_batch_cached('pylint', run, ['a.py'], '.pylintrc'), ([], False))
+        self.assertEqual(self.calls, 2)
+
+    def test_per_file_result_is_reused_until_the_file_changes(self):
+        run = self.runner([{'file': 'a.py', 'line': 1, 'message': 'm'}])
+        for _ in range(2):
+            issues, ok = self.service._run_per_file_cached('flake8', run, ['a.py'], '.flake8')
+            self.assertTrue(ok)
+            self.assertEqual(len(issues), 1)
+        self.assertEqual(self.calls, 1)
+
+        with open(os.path.join(self.repo, 'a.py'), 'w') as f:
+            f.write('x = 2\n')
+        self.service._run_per_file_cached('flake8', run, ['a.py'], '.flake8')
+        self.assertEqual(self.calls, 2)
+
+
+class ResultProcessorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.processor = ResultProcessor()
+
+    def test_merge_results_keeps_the_most_severe_duplicate_and_ranks_by_severity(self):
+        linter_issues = [
+            {'tool': 'flake8', 'severity': 'warning', 'file': 'b.py', 'line': 4, 'message': 'Unused name x'},
+            {'tool': 'pylint', 'severity': 'high', 'file': 'b.py', 'line': 4, 'message': 'unused name x'},
+            {'tool': 'bandit', 'severity': 'security', 'file': 'a.py', 'line': 9, 'message': 'Use of eval'},
+        ]
+        ai_issues = [{'severity': 'error', 'line': 2, 'message': 'NameError: y is not defined'}]
+
+        merged = self.processor.merge_results(linter_issues, ai_issues)
+
+        self.assertEqual(
+            [(issue['tool'], issue['severity'], issue['file'], issue['line']) for issue in merged],
+            [('bandit', 'security', 'a.py', 9), ('shard-ai', 'error', '', 2), ('pylint', 'error', 'b.py', 4)]
+        )
+
+    def test_generate_verdict(self):
+        def issue(severity, tool='flake8', code='', message='m'):
+            return {'tool': tool, 'severity': severity, 'code': code, 'message': message}
+
+        cases = [
+            ([], 'approve'),
+            ([issue('warning')] * 3, 'approve'),
+            ([issue('warning')] * 21, 'deny'),
+            ([issue('error')], 'deny'),
+            ([issue('error', message='Flask app is not being run directly')], 'approve'),
+            ([issue('error', code='syntax-error', message='Flask app is not being run directly')], 'deny'),
+            ([issue('security', tool='shard-ai')], 'manual_review'),
+            ([issue('security')] * 11, 'deny'),
+        ]
+        for issues, verdict in cases:
+            with self.subTest(issues=issues[:1], count=len(issues)):
+                result = self.processor.generate_verdict(issues, 'ai-review')
+                self.assertEqual(result['verdict'], verdict)
+                self.assertEqual(result['issue_count'], len(issues))
+
+        breakdown = self.processor.generate_verdict([], 'ai-review')['severity_breakdown']
+        self.assertEqual(breakdown, {'security': 0, 'error': 0, 'warning': 0})
+
+
+class ModelOutputRecoveryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.runner = ModelRunner()
+
+    def test_complete_issues_are_recovered_from_truncated_output(self):
+        text = (
+            'Here are the issues:\n[{"line": 3, "message": "SQL injection in query", "suggestion": "Bind it"}, '
+            '{"line": 7, "message": "os.system call'
+        )
+        issues = self.runner._clean_and_parse_json(text)
+        self.assertEqual([(issue['line'], issue['severity']) for issue in issues], [(3, 'security')])
+
+    def test_wrapped_issue_list_is_recovered_from_chatty_output(self):
+        text = 'Result: {"issues": [{"line": 1, "message": "name error: foo is not defined"}]} Done.'
+        issues = self.runner._clean_and_parse_json(text)
+        self.assertEqual([(issue['line'], issue['severity']) for issue in issues], [(1, 'error')])
+
+    def test_unparseable_output_yields_a_placeholder(self):
+        issues = self.runner._clean_and_parse_json('[{"line": 1, "mess')
+        self.assertEqual([issue['message'] for issue in issues], ['Failed to parse AI response'])
+
+
+class RepoFingerprintTests(SimpleTestCase):
+
+    def setUp(self):
+        repo = tempfile.TemporaryDirectory()
+        self.addCleanup(repo.cleanup)
+        self.repo = repo.name
+        os.makedirs(os.path.join(self.repo, 'pkg'))
+        os.makedirs(os.path.join(self.repo, 'node_modules'))
+        self.path = os.path.join(self.repo, 'pkg', 'a.py')
+        with open(self.path, 'w') as f:
+            f.write('x = 1\n')
+
+    def test_fingerprint_is_stable_for_an_unchanged_tree(self):
+        self.assertEqual(repo_fingerprint(self.repo), repo_fingerprint(self.repo))
+
+    def test_fingerprint_changes_when_a_file_is_edited(self):
+        before = repo_fingerprint(self.repo)
+        stat = os.stat(self.path)
+        with open(self.path, 'w') as f:
+            f.write('x = 2\n')
+        # Same size; only the mtime tells the edit apart
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertNotEqual(repo_fingerprint(self.repo), before)
+
+    def test_fingerprint_changes_when_a_file_is_added(self):
+        before = repo_fingerprint(self.repo)
+        open(os.path.join(self.repo, 'pkg', 'b.py'), 'w').close()
+        self.assertNotEqual(repo_fingerprint(self.repo), before)
+
+    def test_fingerprint_ignores_skipped_directories(self):
+        before = repo_fingerprint(self.repo)
+        open(os.path.join(self.repo, 'node_modules', 'index.js'), 'w').close()
+        self.assertEqual(repo_fingerprint(self.repo), before)
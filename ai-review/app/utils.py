@@ -1,22 +1,150 @@
+import hashlib
 import os
 import logging
-from typing import List, Dict, Any
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterator, List, Dict, Any, Optional, Tuple
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # Supported source file extensions
 VALID_EXTENSIONS = ('.py', '.js', '.jsx', '.ts', '.tsx')
+_VALID_EXTENSION_SET = frozenset(VALID_EXTENSIONS)
+
+# File reads are I/O bound and release the GIL, so a few threads keep the disk
+# busy; at most _READ_AHEAD reads are in flight beyond the one being consumed
+_READ_WORKERS = 8
+_READ_AHEAD = 2 * _READ_WORKERS
 
 # Files and directories to skip
 SKIP_DIRS = {'node_modules', '.git', '__pycache__', '.venv', 'venv', 'env', 'dist', 'build', '.next', 'target', 'vendor'}
 SKIP_FILES = {'.env', '.env.local', '.env.production', 'package-lock.json', 'yarn.lock', 'Pipfile.lock'}
 
+# Directories skipped by both file collection and the AI project context, so
+# their contents cannot affect a review
+_FINGERPRINT_SKIP_DIRS = frozenset({'.git', '.venv', '.next', 'node_modules', '__pycache__', 'venv', 'env'})
+
 # Absolute path to cloned repos
 BASE_REPO_DIR = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "../../deployment-worker/repos/")
 )
 
+def _iter_file_entries(root_dir: str) -> Iterator[os.DirEntry]:
+    """
+    Yield the non-directory entries under root_dir in os.walk order, pruning
+    SKIP_DIRS. Each DirEntry carries its cached type and stat information.
+    """
+    stack = [root_dir]
+    while stack:
+        current = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if not is_dir:
+                        yield entry
+                    # Like os.walk, symlinked directories are not followed
+                    elif entry.name not in SKIP_DIRS and not entry.is_symlink():
+                        subdirs.append(entry.path)
+        except OSError:
+            continue
+        # Reverse so directories are visited in listing order
+        stack.extend(reversed(subdirs))
+
+def _iter_candidates(root_dir: str) -> Iterator[Tuple[os.DirEntry, str]]:
+    """Yield each collectable file under root_dir with its extension."""
+    for entry in _iter_file_entries(root_dir):
+        fname = entry.name
+        if fname in SKIP_FILES:
+            continue
+        _, dot, ext = fname.rpartition('.')
+        ext = dot + ext
+        if dot and ext in _VALID_EXTENSION_SET:
+            yield entry, ext
+
+def _read_code_file(entry: os.DirEntry, ext: str, max_file_size: int) -> Optional[Dict[str, Any]]:
+    """
+    Read one candidate file into its collected entry, or return None if it is
+    too large or blank. Read failures produce an entry carrying the error.
+    """
+    full_path = entry.path
+    try:
+        # Reading one byte past the limit sizes the file without a separate
+        # stat, and never pulls more than that from an oversized file
+        with open(full_path, "rb") as f:
+            raw = f.read(max_file_size + 1)
+            if len(raw) > max_file_size:
+                file_size = os.fstat(f.fileno()).st_size
+                logger.info(f"Skipping large file {full_path} ({file_size} bytes)")
+                return None
+        file_size = len(raw)
+        
+        # One decode instead of the text layer's chunked decoding; newlines
+        # are normalized as text mode would
+        content = raw.decode("utf-8", "ignore")
+        if "\r" in content:
+            content = content.replace("\r\n", "\n").replace("\r", "\n")
+        
+        # Skip empty files or files with only whitespace
+        if not content.strip():
+            return None
+            
+        return {
+            "file_path": full_path,
+            "content": content,
+            "size": file_size,
+            "extension": ext
+        }
+        
+    except Exception as e:
+        logger.error(f"Error reading {full_path}: {e}")
+        # Add error entry for tracking
+        return {
+            "file_path": full_path,
+            "content": "",
+            "error": str(e),
+            "size": 0,
+            "extension": ext
+        }
+
+def repo_fingerprint(repo_path: str) -> str:
+    """
+    Digest the relative path, size and mtime of every file and directory under
+    repo_path. Any edit that could change a review of the tree changes it.
+    """
+    prefix_len = len(os.path.join(repo_path, ''))
+    records = []
+    stack = [repo_path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    rel_path = entry.path[prefix_len:]
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in _FINGERPRINT_SKIP_DIRS:
+                                records.append(f"{rel_path}/\n")
+                                stack.append(entry.path)
+                            continue
+                        # Follows symlinks, as the readers do
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    records.append(f"{rel_path}\0{st.st_size}\0{st.st_mtime_ns}\n")
+        except OSError:
+            continue
+    # Listing order is filesystem-dependent; sort so the digest only reflects content
+    records.sort()
+    data = ''.join(records).encode('utf-8', 'surrogateescape')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
 def collect_code_files(project_id: str) -> List[Dict[str, Any]]:
     """Collect code files from project repository using project ID."""
     repo_path = os.path.join(BASE_REPO_DIR, project_id)
@@ -33,56 +161,31 @@ def collect_code_files_from_path(repo_path: str) -> List[Dict[str, Any]]:
     max_files = int(os.getenv('MAX_FILES_TO_ANALYZE', '50'))  # Limit files to analyze
     max_file_size = int(os.getenv('MAX_FILE_SIZE_KB', '100')) * 1024  # 100KB default
     
-    for root, dirs, files in os.walk(repo_path):
-        # Skip certain directories
-        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
-        
-        for fname in files:
+    candidates = _iter_candidates(repo_path)
+    
+    # Reads run ahead of the walk on a small pool, but results are consumed in
+    # walk order so the file limit cuts off at the same place as a serial scan
+    with ThreadPoolExecutor(max_workers=_READ_WORKERS) as executor:
+        pending = deque(
+            executor.submit(_read_code_file, entry, ext, max_file_size)
+            for entry, ext in islice(candidates, _READ_AHEAD)
+        )
+        while pending:
             if file_count >= max_files:
                 logger.warning(f"Reached maximum file limit ({max_files}), stopping analysis")
+                for future in pending:
+                    future.cancel()
                 break
-                
-            if fname in SKIP_FILES:
+            
+            result = pending.popleft().result()
+            for entry, ext in islice(candidates, 1):
+                pending.append(executor.submit(_read_code_file, entry, ext, max_file_size))
+            
+            if result is None:
                 continue
-                
-            if fname.endswith(VALID_EXTENSIONS):
-                full_path = os.path.join(root, fname)
-                
-                try:
-                    # Check file size
-                    file_size = os.path.getsize(full_path)
-                    if file_size > max_file_size:
-                        logger.info(f"Skipping large file {full_path} ({file_size} bytes)")
-                        continue
-                    
-                    with open(full_path, "r", encoding="utf-8", errors="ignore") as f:
-                        content = f.read()
-                        
-                        # Skip empty files or files with only whitespace
-                        if not content.strip():
-                            continue
-                            
-                        collected.append({
-                            "file_path": full_path,
-                            "content": content,
-                            "size": file_size,
-                            "extension": os.path.splitext(fname)[1]
-                        })
-                        file_count += 1
-                        
-                except Exception as e:
-                    logger.error(f"Error reading {full_path}: {e}")
-                    # Add error entry for tracking
-                    collected.append({
-                        "file_path": full_path,
-                        "content": "",
-                        "error": str(e),
-                        "size": 0,
-                        "extension": os.path.splitext(fname)[1]
-                    })
-        
-        if file_count >= max_files:
-            break
+            collected.append(result)
+            if "error" not in result:
+                file_count += 1
     
     logger.info(f"Collected {len(collected)} files for analysis from {repo_path}")
     return collected
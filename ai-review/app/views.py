@@ -2,38 +2,149 @@ import logging
 import os
 import json
 import datetime
+import functools
+import hashlib
 import platform
-import psutil
-import tempfile
-import shutil
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Optional
 
 from django.shortcuts import render
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
 from django.views import View
 
-from .analyzer import analyze_code
-from .utils import collect_code_files, collect_code_files_from_path
-from .model_runner import ModelRunner
+from .utils import collect_code_files_from_path, repo_fingerprint
+from .model_runner import AI_FAILURE_MESSAGE, ModelRunner
 from .model_config import model_manager, ModelType
-from .context_analyzer import context_analyzer
 from .linter_service import LinterService
 from .result_processor import ResultProcessor
 
+try:
+    import orjson
+except ImportError:  # Optional speedup; stdlib json is used without it
+    orjson = None
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so handlers are shared
+_json_loads = orjson.loads if orjson else json.loads
+
+@functools.lru_cache(maxsize=None)
+def _get_model_runner(model_type: ModelType) -> ModelRunner:
+    """Return the shared runner for a model type so the model is loaded once per process."""
+    return ModelRunner(model_type=model_type)
+
 # Get the base directory of the project
 BASE_DIR = getattr(settings, 'BASE_DIR', os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
+# Checked-out repositories live in deployment-worker/repos at the monorepo root
+_REPOS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "deployment-worker", "repos"
+)
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Review results keyed by repository path, model type, a fingerprint of the
+# checked-out tree and the linter config mtimes, so repeat reviews of an
+# unchanged repository skip all work
+_REVIEW_CACHE_SIZE = int(os.getenv('REVIEW_CACHE_SIZE', '64'))
+_review_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+_review_cache_lock = threading.Lock()
+
+def _get_cached_review(key: tuple) -> Optional[dict]:
+    """Return the cached review payload for key, or None on a miss."""
+    with _review_cache_lock:
+        payload = _review_cache.get(key)
+        if payload is not None:
+            _review_cache.move_to_end(key)
+        return payload
+
+def _store_review(key: tuple, payload: dict) -> None:
+    """Cache a review payload under key, evicting the least recently used entry."""
+    with _review_cache_lock:
+        _review_cache[key] = payload
+        _review_cache.move_to_end(key)
+        while len(_review_cache) > _REVIEW_CACHE_SIZE:
+            _review_cache.popitem(last=False)
+
+# Host facts reported by the health check do not change while the process runs
+_PLATFORM_SYSTEM = platform.system()
+_PYTHON_VERSION = platform.python_version()
+
+# Process handle for the health check, recreated if the worker has been forked
+_process = None
+
+def _current_process() -> "psutil.Process":
+    """Return this process's handle, primed so cpu_percent() needs no sampling sleep."""
+    # psutil is only needed by the health check, so workers load it on first use
+    import psutil
+
+    global _process
+    pid = os.getpid()
+    if _process is None or _process.pid != pid:
+        _process = psutil.Process(pid)
+        _process.cpu_percent(interval=None)
+    return _process
+
 # AI runner will be initialized per request with user context
 
+def _json_response(payload: dict, status: int = 200) -> HttpResponse:
+    """Encode a JSON payload with orjson, falling back to JsonResponse."""
+    if orjson is not None:
+        try:
+            return HttpResponse(
+                orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS),
+                content_type='application/json',
+                status=status
+            )
+        except TypeError:
+            # orjson.JSONEncodeError; let DjangoJSONEncoder handle e.g. Decimal
+            pass
+    return JsonResponse(payload, status=status)
+
+def _review_response(payload: dict, model_enum: ModelType, etag: str) -> HttpResponse:
+    """Encode a review result with the current model state and the tree's ETag."""
+    response = _json_response(dict(payload, model_loaded=model_enum in model_manager._loaded_models))
+    response['ETag'] = etag
+    return response
+
+def _analyze_file_with_ai(
+    ai_runner: ModelRunner, file_path: str, rel_path: str, file_content: Optional[str] = None
+) -> Optional[list]:
+    """
+    Run the AI pipeline on one file and tag its issues with the relative path.
+    The file is only read from disk when its content is not passed in.
+    Returns None if the analysis failed.
+    """
+    try:
+        if file_content is None:
+            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                file_content = f.read()
+        
+        logger.info(f"AI analyzing file: {rel_path}")
+        
+        ai_issues = ai_runner.analyze(file_content, file_path)
+        if not isinstance(ai_issues, list):
+            return []
+        
+        # Add file context to AI issues
+        for issue in ai_issues:
+            issue['file'] = rel_path
+        return ai_issues
+    
+    except Exception as e:
+        logger.error(f"Error analyzing file {file_path} with AI: {e}")
+        return None
+
 def root(request):
     return render(request, 'root.html')
 
@@ -76,20 +187,22 @@ def health_check(request):
     start_time = datetime.datetime.utcnow()
     try:
         # Basic service status
+        process = _current_process()
         status_info = {
             'status': 'ok',
             'service': 'ai-review',
             'timestamp': start_time.isoformat(),
             'responseTime': 0,  # Will be updated after processing
             'system': {
-                'platform': platform.system(),
+                'platform': _PLATFORM_SYSTEM,
                 'node': platform.node(),
-                'python_version': platform.python_version(),
+                'python_version': _PYTHON_VERSION,
             },
             'process': {
-                'pid': os.getpid(),
-                'cpu_percent': psutil.Process().cpu_percent(interval=0.1),
-                'memory_info': dict(psutil.Process().memory_info()._asdict()),
+                'pid': process.pid,
+                # Usage since the previous health check, without blocking the request
+                'cpu_percent': process.cpu_percent(interval=None),
+                'memory_info': dict(process.memory_info()._asdict()),
             },
             'dependencies': {
                 'django': '3.2.0',  # Update with your Django version
@@ -114,52 +227,65 @@ def health_check(request):
 class CodeReviewView(View):
     def post(self, request):
         try:
-            data = json.loads(request.body)
+            data = _json_loads(request.body)
             project_id = data.get('projectId')
             repo_path = data.get('repoPath')
             model_type = data.get('model_type', 'deepseek_lite')  # Default model
             
             if not project_id:
-                return JsonResponse({
+                return _json_response({
                     'error': 'Project ID is required'
                 }, status=400)
             
             # Determine the repository path
             try:
                 # Look for repo in deployment-worker/repos with project ID prefix
-                base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-                repos_dir = os.path.join(base_dir, "deployment-worker", "repos")
+                repos_dir = _REPOS_DIR
                 
                 if not os.path.exists(repos_dir):
                     raise FileNotFoundError(f"Repository directory not found: {repos_dir}")
                 
-                # Find all directories that start with the project ID
-                matching_dirs = [
-                    os.path.join(repos_dir, d) for d in os.listdir(repos_dir)
-                    if os.path.isdir(os.path.join(repos_dir, d)) and d.startswith(project_id)
-                ]
+                # Find the first directory that starts with the project ID (should
+                # only be one per project ID). Names are filtered before the type
+                # check, which scandir answers from the directory listing itself.
+                with os.scandir(repos_dir) as entries:
+                    target_path = next(
+                        (e.path for e in entries if e.name.startswith(project_id) and e.is_dir()),
+                        None
+                    )
                 
-                if not matching_dirs:
+                if target_path is None:
                     raise FileNotFoundError(
                         f"No repository found for project ID: {project_id} in {repos_dir}"
                     )
                 
-                # Use the first matching directory (should only be one per project ID)
-                target_path = matching_dirs[0]
                 logger.info(f"Found repository at: {target_path}")
                 
+                # An unchanged tree reviewed with the same model and linter
+                # configs gets the same result
+                linter_service = LinterService(target_path)
+                config_stamps = linter_service.config_stamps()
+                fingerprint = repo_fingerprint(target_path)
+                review_key = (target_path, str(model_type), fingerprint, config_stamps)
+                config_tag = hashlib.blake2b(repr(config_stamps).encode(), digest_size=8).hexdigest()
+                etag = f'"{model_type}:{fingerprint}:{config_tag}"'
+                cached_review = _get_cached_review(review_key)
+                if cached_review is not None:
+                    logger.info(f"Repository unchanged since its last {model_type} review, reusing the result")
+                    return _review_response(cached_review, ModelType(model_type), etag)
+                
                 # Collect code files for analysis
                 file_data = collect_code_files_from_path(target_path)
                 
             except Exception as e:
                 logger.error(f"Error finding repository: {str(e)}")
-                return JsonResponse({
+                return _json_response({
                     'error': f'Repository not found: {str(e)}',
                     'details': f'Searched in: {repos_dir if "repos_dir" in locals() else "[path not determined]"}'
                 }, status=404)
             
             if not file_data:
-                return JsonResponse({
+                return _json_response({
                     'verdict': 'allow',
                     'reason': 'No code files found to analyze',
                     'issue_count': 0,
@@ -168,60 +294,65 @@ class CodeReviewView(View):
             
             # Extract file paths from the file data
             files = [f['file_path'] for f in file_data if 'file_path' in f]
+            # Collected paths are joined onto target_path, so slicing off the
+            # prefix gives the relative path without relpath's normalization
+            prefix = os.path.join(target_path, '')
+            rel_paths = [
+                f[len(prefix):] if f.startswith(prefix) else os.path.relpath(f, target_path)
+                for f in files
+            ]
             
             logger.info(f"Analyzing {len(files)} files for project {project_id}")
             
             # Initialize services
-            linter_service = LinterService(target_path)
             result_processor = ResultProcessor()
             
-            # Run linters on all files
-            logger.info("Running static analysis linters...")
-            linter_issues = linter_service.run_all_linters([os.path.relpath(f, target_path) for f in files])
-            
             # Validate model type
             try:
                 model_enum = ModelType(model_type)
                 logger.info(f"Using AI model: {model_type}")
             except ValueError:
                 available_models = [m.value for m in ModelType]
-                return JsonResponse({
+                return _json_response({
                     'error': f'Invalid model type: {model_type}',
                     'available_models': available_models
                 }, status=400)
             
-            # Initialize the AI model runner once with the selected model
+            # Reuse the process-wide runner for the selected model
             logger.info(f"Initializing AI model runner with {model_type}...")
-            ai_runner = ModelRunner(model_type=model_enum)
+            ai_runner = _get_model_runner(model_enum)
 
-            # Run AI analysis
-            logger.info(f"Running AI code analysis with model: {model_type}...")
-            deepseek_issues = []
-            
             # Analyze up to 5 most important files with AI
             important_files = files[:5]
+            important_rel_paths = rel_paths[:5]
+            # collect_code_files_from_path already read these; don't read them again
+            contents = {f['file_path']: f['content'] for f in file_data if 'error' not in f}
             
-            for file_path in important_files:
-                try:
-                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        file_content = f.read()
-                    
-                    # Get relative path for display
-                    rel_path = os.path.relpath(file_path, target_path)
-                    logger.info(f"AI analyzing file: {rel_path}")
-                    
-                    # Use the single AI runner instance for analysis
-                    ai_issues = ai_runner.analyze(file_content, file_path)
-                    
-                    # Add file context to AI issues
-                    if isinstance(ai_issues, list):
-                        for issue in ai_issues:
-                            issue['file'] = rel_path
-                            deepseek_issues.append(issue)
-                    
-                except Exception as e:
-                    logger.error(f"Error analyzing file {file_path} with AI: {e}")
-                    continue
+            # The linters run as subprocesses on one extra thread while the AI
+            # stage works, so the review waits for the slower of the two rather
+            # than both. Threads share the single AI runner; inference itself is
+            # serialized by the model lock, but linting and prompt building of
+            # one file overlap generation for another
+            max_workers = min(len(important_files), int(os.getenv('MAX_ANALYSIS_WORKERS', '4'))) or 1
+            with ThreadPoolExecutor(max_workers=max_workers + 1) as executor:
+                # Run linters on all files
+                logger.info("Running static analysis linters...")
+                linter_future = executor.submit(
+                    linter_service.run_all_linters, rel_paths
+                )
+                
+                # Run AI analysis
+                logger.info(f"Running AI code analysis with model: {model_type}...")
+                per_file = executor.map(
+                    lambda file_path, rel_path: _analyze_file_with_ai(
+                        ai_runner, file_path, rel_path, contents.get(file_path)
+                    ),
+                    important_files, important_rel_paths
+                )
+                # map() yields in submission order, keeping the output deterministic
+                per_file = list(per_file)
+                deepseek_issues = list(chain.from_iterable(issues for issues in per_file if issues))
+                linter_issues, linters_complete = linter_future.result()
             
             # Merge and process all results
             logger.info("Processing and merging analysis results...")
@@ -231,7 +362,7 @@ class CodeReviewView(View):
             
             logger.info(f"Analysis complete for project {project_id}: {verdict_result['verdict']} ({verdict_result['issue_count']} issues)")
             
-            return JsonResponse({
+            payload = {
                 'verdict': verdict_result['verdict'],
                 'reason': verdict_result['reason'],
                 'issue_count': verdict_result['issue_count'],
@@ -239,22 +370,41 @@ class CodeReviewView(View):
                 'issues': verdict_result['issues'][:50],  # Limit to first 50 issues
                 'linter_count': len(linter_issues),
                 'ai_count': len(deepseek_issues),
-                'model_used': model_type,
-                'model_loaded': model_enum in model_manager._loaded_models
-            })
+                'model_used': model_type
+            }
+            
+            # Only a review where the model ran on every file and every linter
+            # succeeded may be replayed; a degraded one is retried next time
+            ai_complete = (
+                model_enum in model_manager._loaded_models
+                and None not in per_file
+                and not any(issue.get('message') == AI_FAILURE_MESSAGE for issue in deepseek_issues)
+            )
+            if ai_complete and linters_complete:
+                _store_review(review_key, payload)
+            
+            return _review_response(payload, model_enum, etag)
             
         except json.JSONDecodeError:
-            return JsonResponse({
+            return _json_response({
                 'error': 'Invalid JSON in request body'
             }, status=400)
+        except RequestDataTooBig:
+            # request.body refuses bodies over DATA_UPLOAD_MAX_MEMORY_SIZE before reading them
+            return _json_response({
+                'error': 'Request body too large'
+            }, status=413)
         except Exception as e:
             logger.error(f"Code review failed: {e}")
-            return JsonResponse({
+            return _json_response({
                 'error': f'Code review failed: {str(e)}'
             }, status=500)
         finally:
-            logger.info("Clearing AI model cache after request.")
-            model_manager.unload_all_models()
+            # Keeping the model resident avoids a multi-GB reload on every request
+            if os.getenv('AI_MODEL_UNLOAD_AFTER_REQUEST', '0') == '1':
+                logger.info("Clearing AI model cache after request.")
+                _get_model_runner.cache_clear()
+                model_manager.unload_all_models()
 
 
 
@@ -275,21 +425,13 @@ def process_analysis_results(issues):
             'ai_count': 0
         }
     
-    # Count issues by severity and tool
-    severity_breakdown = {'security': 0, 'error': 0, 'warning': 0}
-    tool_breakdown = {'linter': 0, 'ai': 0}
-    
-    for issue in issues:
-        severity = issue.get('severity', 'warning')
-        tool = issue.get('tool', 'unknown')
-        
-        if severity in severity_breakdown:
-            severity_breakdown[severity] += 1
-        
-        if 'shard-ai' in tool.lower():
-            tool_breakdown['ai'] += 1
-        else:
-            tool_breakdown['linter'] += 1
+    # Count issues by severity and tool; Counter and sum() tally in C
+    severity_counts = Counter(issue.get('severity', 'warning') for issue in issues)
+    severity_breakdown = {
+        level: severity_counts[level] for level in ('security', 'error', 'warning')
+    }
+    ai_count = sum('shard-ai' in issue.get('tool', 'unknown').lower() for issue in issues)
+    tool_breakdown = {'linter': len(issues) - ai_count, 'ai': ai_count}
     
     # Determine verdict
     error_count = severity_breakdown['error']
@@ -0,0 +1,37 @@
+// Long-lived ESLint worker used by LinterService.run_eslint.
+// Reads one JSON request per line: {"cwd": ..., "config": ..., "files": [...]}
+// and writes one JSON line back: {"results": [...]} or {"error": "..."}.
+// Results have the same shape as `eslint --format json`.
+const readline = require('readline');
+const { ESLint } = require('eslint');
+
+let current = { key: null, eslint: null };
+
+function getESLint(cwd, config) {
+  // Same options as `eslint --no-eslintrc --config <config>` run from cwd
+  const key = `${cwd}\0${config}`;
+  if (current.key !== key) {
+    current = {
+      key,
+      eslint: new ESLint({ cwd, useEslintrc: false, overrideConfigFile: config }),
+    };
+  }
+  return current.eslint;
+}
+
+async function main() {
+  const rl = readline.createInterface({ input: process.stdin, crlfDelay: Infinity });
+  for await (const line of rl) {
+    if (!line.trim()) continue;
+    let response;
+    try {
+      const { cwd, config, files } = JSON.parse(line);
+      response = { results: await getESLint(cwd, config).lintFiles(files) };
+    } catch (err) {
+      response = { error: String((err && err.message) || err) };
+    }
+    process.stdout.write(JSON.stringify(response) + '\n');
+  }
+}
+
+main();